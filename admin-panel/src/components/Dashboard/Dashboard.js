@@ -2,10 +2,15 @@ import React, { useEffect, useState } from "react";
 import "./Dashboard.css";
 import { useNavigate } from "react-router-dom";
 
+const USER_PAGE_SIZE = 50;
+
 function Dashboard() {
     const [overview, setOverview] = useState({ totalUsers: 0, totalBooks: 0 });
     const [query, setQuery] = useState("");
     const [users, setUsers] = useState([]);
+    const [substring, setSubstring] = useState(false);
+    const [userSearch, setUserSearch] = useState({ query: "", mode: "prefix" });
+    const [userCursor, setUserCursor] = useState(null);
     const [books, setBooks] = useState([]);
     const [tokenLogs, setTokenLogs] = useState({ summary: {}, logs: [] });
     const navigate = useNavigate();
@@ -13,17 +18,11 @@ function Dashboard() {
 
     const fetchOverview = async () => {
         try {
-            const [bookRes, userRes] = await Promise.all([
-                fetch("http://127.0.0.1:8080/admin/books/count", {
-                    headers: { Authorization: `Bearer ${token}` }
-                }),
-                fetch("http://127.0.0.1:8080/admin/users/search?query=", {
-                    headers: { Authorization: `Bearer ${token}` }
-                })
-            ]);
-            const bookData = await bookRes.json();
-            const userData = await userRes.json();
-            setOverview({ totalBooks: bookData.total_books, totalUsers: userData.length });
+            const res = await fetch("http://127.0.0.1:8080/admin/overview", {
+                headers: { Authorization: `Bearer ${token}` }
+            });
+            const data = await res.json();
+            setOverview({ totalBooks: data.total_books, totalUsers: data.total_users });
         } catch {
             alert("Không thể lấy dữ liệu hệ thống.");
         }
@@ -37,12 +36,24 @@ function Dashboard() {
         setTokenLogs(data);
     };
 
-    const searchUsers = async () => {
-        const res = await fetch(`http://127.0.0.1:8080/admin/users/search?query=${query}`, {
+    // Prefix search by default, which the username/email indexes answer; substring
+    // (e.g. "gmail" inside emails) is opt-in since it can scan the whole table. Results
+    // come in pages; the server sends X-Next-Cursor while there are more, passed back
+    // as after_id.
+    const searchUsers = async (search = { query, mode: substring ? "substring" : "prefix" }, afterId = 0) => {
+        const params = new URLSearchParams({
+            query: search.query,
+            mode: search.mode,
+            limit: USER_PAGE_SIZE,
+            after_id: afterId
+        });
+        const res = await fetch(`http://127.0.0.1:8080/admin/users/search?${params}`, {
             headers: { Authorization: `Bearer ${token}` }
         });
         const data = await res.json();
-        setUsers(data);
+        setUsers(prev => (afterId ? [...prev, ...data] : data));
+        setUserSearch(search);
+        setUserCursor(res.headers.get("X-Next-Cursor"));
     };
 
     const deleteUser = async (id) => {
@@ -50,7 +61,7 @@ function Dashboard() {
             method: "DELETE",
             headers: { Authorization: `Bearer ${token}` }
         });
-        searchUsers();
+        setUsers(prev => prev.filter(user => user.id !== id));
     };
 
     const searchBooks = async () => {
@@ -98,7 +109,15 @@ function Dashboard() {
                     value={query}
                     onChange={(e) => setQuery(e.target.value)}
                 />
-                <button onClick={searchUsers}>Tìm User</button>
+                <label>
+                    <input
+                        type="checkbox"
+                        checked={substring}
+                        onChange={(e) => setSubstring(e.target.checked)}
+                    />
+                    Tìm user theo chuỗi con (chậm hơn)
+                </label>
+                <button onClick={() => searchUsers()}>Tìm User</button>
                 <button onClick={searchBooks}>Tìm Sách</button>
             </div>
 
@@ -112,6 +131,9 @@ function Dashboard() {
                         </li>
                     ))}
                 </ul>
+                {userCursor && (
+                    <button onClick={() => searchUsers(userSearch, userCursor)}>Xem thêm</button>
+                )}
             </div>
 
             <div className="section">
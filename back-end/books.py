@@ -0,0 +1,268 @@
+from text_folding import tokenize
+from bisect import bisect_left
+from collections import defaultdict
+import json
+import os
+import threading
+import numpy as np
+import pandas as pd
+
+BOOK_FIELDS = ["id", "title", "author", "publishing_year", "thumbnail",
+               "description", "publisher", "num_pages", "language", "categories", "link"]
+METADATA_FIELDS = [field for field in BOOK_FIELDS if field != "id"]
+# Fields holding several values joined with " / " (crawl_fahasa.py). A filter on one
+# matches books that carry any of the requested values.
+MULTI_VALUE_FIELDS = ("categories",)
+
+def split_values(value):
+    return frozenset(part.strip() for part in str(value).split("/") if part.strip())
+
+# Book ids and metadata columns as arrays, with the numeric fields typed as Milvus
+# stores them, so filters and hits behave the same for every backend. Multi-value
+# fields also get their split values under "<field>_values", for filtering.
+def book_columns(frame):
+    frame = frame.fillna("")
+    for field in METADATA_FIELDS:
+        if field not in frame:
+            frame[field] = ""
+    for field in ("publishing_year", "num_pages"):
+        frame[field] = pd.to_numeric(frame[field], errors="coerce").fillna(0).astype(int)
+    ids = frame["id"].astype(str).str.strip().str.removesuffix(".0").to_numpy()
+    columns = {field: frame[field].to_numpy() for field in METADATA_FIELDS}
+    for field in MULTI_VALUE_FIELDS:
+        values = np.empty(len(ids), dtype=object)
+        values[:] = [split_values(v) for v in columns[field]]
+        columns[f"{field}_values"] = values
+    return ids, columns
+
+# Milvus caps the length of an expression, so large `id in [...]` lookups are split.
+QUERY_CHUNK_SIZE = 500
+
+def fetch_books(collection, book_ids, output_fields=BOOK_FIELDS, chunk_size=QUERY_CHUNK_SIZE):
+    ids = list(dict.fromkeys(str(book_id) for book_id in book_ids))
+    found = {}
+    for i in range(0, len(ids), chunk_size):
+        chunk = ids[i:i + chunk_size]
+        rows = collection.query(
+            expr=f"id in {json.dumps(chunk)}",
+            output_fields=output_fields,
+            limit=len(chunk)
+        )
+        for row in rows:
+            found[str(row["id"])] = row
+
+    books = [found[book_id] for book_id in ids if book_id in found]
+    missing = [book_id for book_id in ids if book_id not in found]
+    return books, missing
+
+# Admin search ranks title matches above author and category matches.
+SEARCH_FIELDS = {"title": 3.0, "author": 2.0, "categories": 1.0}
+
+# Inverted index of folded tokens -> (positions, field weight) for admin book search.
+# Every query token is matched as a prefix of indexed tokens and all of them must
+# match; rarer tokens weigh more.
+class BookSearchIndex:
+    def __init__(self, columns):
+        postings = defaultdict(lambda: defaultdict(float))
+        for field, weight in SEARCH_FIELDS.items():
+            for position, value in enumerate(columns[field]):
+                for token in set(tokenize(value)):
+                    postings[token][position] += weight
+        self.size = len(columns["id"])
+        self.titles = columns["title"]
+        self.vocabulary = sorted(postings)
+        self.postings = []
+        for token in self.vocabulary:
+            positions = postings[token]
+            rows = np.fromiter(positions.keys(), dtype=np.int64, count=len(positions))
+            weights = np.fromiter(positions.values(), dtype=np.float32, count=len(positions))
+            idf = np.log(1 + self.size / len(rows))
+            self.postings.append((rows, weights * idf))
+
+    def _token_scores(self, token):
+        scores = np.zeros(self.size, dtype=np.float32)
+        start = bisect_left(self.vocabulary, token)
+        end = bisect_left(self.vocabulary, token + "\uffff", lo=start)
+        for i in range(start, end):
+            rows, weights = self.postings[i]
+            # A whole-word match outranks a longer word that merely starts with the token.
+            weights = weights if self.vocabulary[i] == token else weights * 0.5
+            np.maximum.at(scores, rows, weights)
+        return scores
+
+    # Returns (total matches, positions of the requested page), best first.
+    def search(self, query, alive, limit, offset=0):
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            rows = np.flatnonzero(alive)
+            return len(rows), rows[offset:offset + limit]
+        scores = np.zeros(self.size, dtype=np.float32)
+        mask = alive.copy()
+        for token in tokens:
+            token_scores = self._token_scores(token)
+            mask &= token_scores > 0
+            if not mask.any():
+                return 0, []
+            scores += token_scores
+        rows = np.flatnonzero(mask)
+        end = min(offset + limit, len(rows))
+        if offset >= end:
+            return len(rows), []
+        top = rows[np.argpartition(-scores[rows], end - 1)[:end]] if end < len(rows) else rows
+        top = sorted(top, key=lambda row: (-scores[row], self.titles[row]))
+        return len(rows), top[offset:end]
+
+# Ids of books deleted through the admin panel, appended one per line, so deletions
+# survive restarts and reach every worker. Readers call refresh(), which re-reads the
+# file only when it changed, and compare `version` with what they last applied.
+class Tombstones:
+    def __init__(self, path):
+        self.path = path
+        self.ids = frozenset()
+        self.version = 0
+        self._mtime = None
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def _stat(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _load(self, mtime):
+        ids = set()
+        if mtime is not None:
+            with open(self.path, encoding="utf-8") as f:
+                ids = {line.strip() for line in f if line.strip()}
+        if ids != self.ids:
+            self.ids = frozenset(ids)
+            self.version += 1
+        self._mtime = mtime
+
+    def refresh(self):
+        mtime = self._stat()
+        if mtime != self._mtime:
+            with self._lock:
+                if mtime != self._mtime:
+                    self._load(mtime)
+        return self.version
+
+    # Clears `alive` for the deleted books found in `positions` (id -> row) if the file
+    # changed since `applied_version`, and returns the version now applied.
+    def apply(self, positions, alive, applied_version, lock):
+        version = self.refresh()
+        if version != applied_version:
+            deleted = self.ids
+            with lock:
+                for book_id in deleted:
+                    position = positions.get(book_id)
+                    if position is not None:
+                        alive[position] = False
+        return version
+
+    def add(self, book_ids):
+        new = [str(book_id) for book_id in book_ids if str(book_id) not in self.ids]
+        if not new:
+            return
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("".join(f"{book_id}\n" for book_id in new))
+            # Re-read rather than merge, to also pick up other workers' appends.
+            self._load(self._stat())
+
+deleted_books = Tombstones(os.environ.get("DELETED_BOOKS_PATH", "./deleted_books.txt"))
+
+# Metadata for every book, held column by column and keyed by id, so favorites and
+# admin views never have to go through Milvus scalar queries. Loaded from
+# books_full.csv or an export written by data/extract_milvus.py.
+class BookStore:
+    def __init__(self, path, tombstones=deleted_books):
+        self.path = path
+        self.tombstones = tombstones
+        self.listeners = []
+        self._lock = threading.Lock()
+        self.reload()
+
+    # Indexes derived from the metadata register here to be rebuilt on every reload.
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+        listener(self.frame)
+
+    def reload(self):
+        mtime = os.path.getmtime(self.path)
+        frame = pd.read_csv(self.path, dtype=str, keep_default_na=False)
+        ids, columns = book_columns(frame)
+        columns["id"] = ids
+        search_index = BookSearchIndex(columns)
+        positions = {book_id: i for i, book_id in enumerate(ids)}
+        alive = np.zeros(len(ids), dtype=bool)
+        alive[list(positions.values())] = True
+        version = self.tombstones.apply(positions, alive, None, self._lock)
+        with self._lock:
+            self.frame = frame
+            self.columns = columns
+            self.positions = positions
+            self.alive = alive
+            self.search_index = search_index
+            self.mtime = mtime
+            self.deleted_version = version
+        for listener in self.listeners:
+            listener(frame)
+
+    # Picks up a books_full.csv rewritten by ingestion without waiting for /admin/books/reload.
+    def refresh(self):
+        if os.path.getmtime(self.path) != self.mtime:
+            self.reload()
+
+    # Applies deletions made since the last load, including by other workers.
+    def _apply_deletions(self):
+        self.deleted_version = self.tombstones.apply(self.positions, self.alive, self.deleted_version, self._lock)
+
+    def _position(self, book_id):
+        position = self.positions.get(str(book_id))
+        return position if position is not None and self.alive[position] else None
+
+    def __len__(self):
+        self._apply_deletions()
+        return int(self.alive.sum())
+
+    def __contains__(self, book_id):
+        self._apply_deletions()
+        with self._lock:
+            return self._position(book_id) is not None
+
+    def _record(self, position, fields, columns=None):
+        columns = columns or self.columns
+        record = {}
+        for field in fields:
+            value = columns[field][position]
+            record[field] = value.item() if hasattr(value, "item") else value
+        return record
+
+    def get_many(self, book_ids, fields=BOOK_FIELDS):
+        ids = list(dict.fromkeys(str(book_id) for book_id in book_ids))
+        books, missing = [], []
+        self._apply_deletions()
+        with self._lock:
+            for book_id in ids:
+                position = self._position(book_id)
+                if position is None:
+                    missing.append(book_id)
+                else:
+                    books.append(self._record(position, fields))
+        return books, missing
+
+    # Returns (total matches, one page of records).
+    def search(self, query, fields=("id", "title", "author", "categories"), limit=100, offset=0):
+        self._apply_deletions()
+        with self._lock:
+            search_index = self.search_index
+            alive = self.alive.copy()
+            columns = self.columns
+        total, rows = search_index.search(query, alive, limit, offset)
+        return total, [self._record(row, fields, columns) for row in rows]
+
+    def discard(self, book_id):
+        self.tombstones.add([book_id])
+        self._apply_deletions()
@@ -1,30 +1,25 @@
-from userdb import SessionLocal
+from userdb import session_scope
 from model import AdminInDB
-from passlib.context import CryptContext
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from password_hashing import hash_password
 
 admin_username = "admin"
 admin_email = "admin@example.com"
 admin_password = "Admin@123"
 
-db = SessionLocal()
-
-existing = db.query(AdminInDB).filter(
-    (AdminInDB.username == admin_username) | (AdminInDB.email == admin_email)
-).first()
-
-if existing:
-    print("Admin user already exists.")
-else:
-    hashed_pw = pwd_context.hash(admin_password)
-    new_admin = AdminInDB(
-        username=admin_username,
-        email=admin_email,
-        password=hashed_pw
-    )
-    db.add(new_admin)
-    db.commit()
-    print("Admin user created successfully.")
+with session_scope() as db:
+    existing = db.query(AdminInDB).filter(
+        (AdminInDB.username == admin_username) | (AdminInDB.email == admin_email)
+    ).first()
 
-db.close()
+    if existing:
+        print("Admin user already exists.")
+    else:
+        hashed_pw = hash_password(admin_password)
+        new_admin = AdminInDB(
+            username=admin_username,
+            email=admin_email,
+            password=hashed_pw
+        )
+        db.add(new_admin)
+        db.commit()
+        print("Admin user created successfully.")
@@ -0,0 +1,27 @@
+from userdb import engine, session_scope
+from model import FavoriteInDB
+from sqlalchemy import func, inspect
+
+# Removes duplicate (user_id, book_id) favorites, keeping the oldest row, then adds the
+# unique index that prevents new duplicates.
+
+with session_scope() as db:
+    keep = db.query(func.min(FavoriteInDB.id)).group_by(FavoriteInDB.user_id, FavoriteInDB.book_id)
+    keep_ids = {row[0] for row in keep}
+    duplicate_ids = [row[0] for row in db.query(FavoriteInDB.id) if row[0] not in keep_ids]
+    for i in range(0, len(duplicate_ids), 1000):
+        db.query(FavoriteInDB).filter(FavoriteInDB.id.in_(duplicate_ids[i:i + 1000])).delete(synchronize_session=False)
+    db.commit()
+    print(f"Removed {len(duplicate_ids)} duplicate favorites.")
+
+existing = {c["name"] for c in inspect(engine).get_unique_constraints("favorites")}
+existing |= {i["name"] for i in inspect(engine).get_indexes("favorites")}
+if "uq_favorite_user_book" in existing:
+    print("Unique index already exists.")
+else:
+    with engine.begin() as conn:
+        if engine.dialect.name == "mysql":
+            # A VARCHAR column needs a length before MySQL can index it.
+            conn.exec_driver_sql("ALTER TABLE favorites MODIFY book_id VARCHAR(64)")
+        conn.exec_driver_sql("CREATE UNIQUE INDEX uq_favorite_user_book ON favorites (user_id, book_id)")
+    print("Unique index created.")
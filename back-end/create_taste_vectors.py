@@ -0,0 +1,8 @@
+from userdb import engine
+from model import UserTasteVector
+
+# Creates the user_taste_vectors table. Rows are built lazily: the first "for you"
+# request of a user sums the embeddings of their favorites.
+
+UserTasteVector.__table__.create(bind=engine, checkfirst=True)
+print("user_taste_vectors table is ready.")
@@ -0,0 +1,47 @@
+from userdb import engine, session_scope
+from model import TokenUsageRollup
+from usage_recorder import rollup_statement, rollup_values
+from sqlalchemy import inspect, text
+from datetime import datetime
+
+# Creates the openai_usage_rollups table and rebuilds it from the existing openai_logs rows.
+# Also indexes openai_logs by (created_at, id) for the raw-log pages of /admin/token-usage.
+
+batch_size = 5000
+
+TokenUsageRollup.__table__.create(bind=engine, checkfirst=True)
+
+if "ix_openai_logs_created_at" not in {index["name"] for index in inspect(engine).get_indexes("openai_logs")}:
+    with engine.begin() as conn:
+        conn.execute(text("CREATE INDEX ix_openai_logs_created_at ON openai_logs (created_at, id)"))
+
+with session_scope() as db:
+    db.query(TokenUsageRollup).delete()
+
+    # Aggregate while streaming the logs, then write once the cursor is exhausted.
+    rows = db.execute(
+        text("SELECT purpose, input_tokens, output_tokens, created_at FROM openai_logs")
+    ).yield_per(batch_size)
+
+    totals = {}
+    total = 0
+    for partition in rows.partitions():
+        batch = [
+            {"p": p, "in_t": i, "out_t": o, "at": at if isinstance(at, datetime) else datetime.fromisoformat(str(at))}
+            for p, i, o, at in partition
+        ]
+        for value in rollup_values(batch):
+            key = (value["period"], value["bucket_start"], value["purpose"])
+            if key in totals:
+                for column in ("requests", "input_tokens", "output_tokens"):
+                    totals[key][column] += value[column]
+            else:
+                totals[key] = value
+        total += len(batch)
+
+    values = list(totals.values())
+    for i in range(0, len(values), batch_size):
+        db.execute(rollup_statement(engine.dialect.name, values[i:i + batch_size]))
+    db.commit()
+
+print(f"Rolled up {total} log rows.")
@@ -0,0 +1,16 @@
+from userdb import engine
+from sqlalchemy import inspect
+
+# Adds the ngram FULLTEXT index used by /admin/users/search?mode=substring when
+# USER_SEARCH_FULLTEXT=1. MySQL only; other databases fall back to a LIKE scan.
+
+if engine.dialect.name != "mysql":
+    print(f"FULLTEXT search needs MySQL, not {engine.dialect.name}; substring search will scan.")
+elif "ft_users_username_email" in {i["name"] for i in inspect(engine).get_indexes("users")}:
+    print("FULLTEXT index already exists.")
+else:
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            "CREATE FULLTEXT INDEX ft_users_username_email ON users (username, email) WITH PARSER ngram"
+        )
+    print("FULLTEXT index created. Set USER_SEARCH_FULLTEXT=1 to use it.")
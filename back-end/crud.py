@@ -1,6 +1,74 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import or_
-from model import UserInDB, FavoriteInDB
+from sqlalchemy import or_, select, func, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from model import UserInDB, FavoriteInDB, UserTasteVector
+from ttl_cache import TTLCache
+import numpy as np
+import os
+import time
+
+# user_id -> frozenset of favorited book ids. Loaded with one query on first use and
+# updated in place by add_to_favorites/remove_from_favorites.
+favorite_sets = TTLCache(
+    max_size=int(os.environ.get("FAVORITES_CACHE_SIZE", 10000)),
+    ttl=float(os.environ.get("FAVORITES_CACHE_TTL", 300))
+)
+
+# MATCH ... AGAINST needs the ngram FULLTEXT index from create_user_search_index.py.
+USER_SEARCH_FULLTEXT = os.environ.get("USER_SEARCH_FULLTEXT", "0") == "1"
+
+# Row count that is recounted at most once per `ttl` seconds and adjusted in place
+# by the writes this process makes in between.
+class CachedCount:
+    def __init__(self, statement, ttl=60):
+        self.statement = statement
+        self.ttl = ttl
+        self.value = None
+        self.expires_at = 0
+        self.recounts = 0
+
+    async def get(self, db: AsyncSession):
+        if self.value is None or self.expires_at <= time.monotonic():
+            self.value = await db.scalar(self.statement)
+            self.expires_at = time.monotonic() + self.ttl
+            self.recounts += 1
+        return self.value
+
+    def adjust(self, delta):
+        if self.value is not None:
+            self.value += delta
+
+    def stats(self):
+        return {"value": self.value, "ttl": self.ttl, "recounts": self.recounts}
+
+user_count = CachedCount(select(func.count()).select_from(UserInDB),
+                         ttl=float(os.environ.get("USER_COUNT_TTL", 60)))
+
+def _escape_like(value: str):
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+# Users with id > after_id in id order, so each page is an index range read however
+# deep the listing goes. "prefix" search stays on the username/email indexes;
+# "substring" uses the FULLTEXT index when enabled and a LIKE scan otherwise.
+async def list_users_async(db: AsyncSession, after_id: int = 0, limit: int = 50, query: str = "", mode: str = "prefix"):
+    statement = select(UserInDB).where(UserInDB.id > after_id)
+    if query:
+        if mode == "substring" and USER_SEARCH_FULLTEXT and db.bind.dialect.name == "mysql":
+            phrase = '"' + query.replace('"', " ") + '"'
+            statement = statement.where(
+                text("MATCH (users.username, users.email) AGAINST (:phrase IN BOOLEAN MODE)").bindparams(phrase=phrase)
+            )
+        else:
+            pattern = _escape_like(query) + "%"
+            if mode == "substring":
+                pattern = "%" + pattern
+            statement = statement.where(or_(
+                UserInDB.username.like(pattern, escape="\\"),
+                UserInDB.email.like(pattern, escape="\\")
+            ))
+    result = await db.execute(statement.order_by(UserInDB.id).limit(limit))
+    return result.scalars().all()
 
 def create_user(db: Session,email: str, username: str, password: str):
     db_user = UserInDB(email = email,username=username, password=password)
@@ -14,19 +82,88 @@ def get_user_by_username_or_email(db: Session, identifier: str):
         or_(UserInDB.username == identifier, UserInDB.email == identifier)
     ).first()
 
-def add_to_favorites(db: Session, user_id: int, book_id: int):
+def get_favorite_ids(db: Session, user_id: int):
+    ids = favorite_sets.get(user_id)
+    if ids is None:
+        rows = db.query(FavoriteInDB.book_id).filter(FavoriteInDB.user_id == user_id).all()
+        ids = frozenset(str(row[0]) for row in rows)
+        favorite_sets.set(user_id, ids)
+    return ids
+
+# Returns (summed embedding, favorite count) or None when the user has no taste vector yet.
+def get_taste_vector(db: Session, user_id: int):
+    taste = db.get(UserTasteVector, user_id)
+    if taste is None:
+        return None
+    return np.frombuffer(taste.vector, dtype=np.float32), taste.favorite_count
+
+def has_taste_vector(db: Session, user_id: int):
+    return db.get(UserTasteVector, user_id) is not None
+
+# Full rebuild from the embeddings of the favorites that still have one. The count is
+# of all favorites, so a favorite without a vector doesn't look like drift forever.
+def save_taste_vector(db: Session, user_id: int, vectors, favorite_count: int):
+    vector = np.sum(vectors, axis=0, dtype=np.float32) if len(vectors) else np.zeros(0, dtype=np.float32)
+    db.merge(UserTasteVector(user_id=user_id, vector=vector.tobytes(), favorite_count=favorite_count))
+    db.commit()
+    return vector, favorite_count
+
+# Adds (delta=1) or subtracts (delta=-1) one favorite's embedding. A user without a
+# taste vector is left alone; the next "for you" request notices the count mismatch
+# and rebuilds it.
+def adjust_taste_vector(db: Session, user_id: int, book_vector, delta: int):
+    taste = db.query(UserTasteVector).filter_by(user_id=user_id).with_for_update().first()
+    if taste is None:
+        return
+    current = np.frombuffer(taste.vector, dtype=np.float32)
+    change = np.asarray(book_vector, dtype=np.float32) * delta
+    taste.vector = (current + change if len(current) else change).tobytes()
+    taste.favorite_count += delta
+    db.commit()
+
+def add_to_favorites(db: Session, user_id: int, book_id: int, book_vector=None):
     db_favorite = FavoriteInDB(user_id=user_id, book_id=book_id)
     db.add(db_favorite)
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        # (user_id, book_id) is unique, so this book is already a favorite.
+        db.rollback()
+        db_favorite = db.query(FavoriteInDB).filter_by(user_id=user_id, book_id=book_id).first()
+    else:
+        if book_vector is not None:
+            adjust_taste_vector(db, user_id, book_vector, 1)
+    ids = favorite_sets.get(user_id)
+    if ids is not None:
+        favorite_sets.set(user_id, ids | {str(book_id)})
     return db_favorite
 
 def is_favorites(db: Session, user_id: int, book_id: str):
-    return db.query(FavoriteInDB).filter_by(user_id=user_id, book_id=book_id).first() is not None
+    return str(book_id) in get_favorite_ids(db, user_id)
 
-def remove_from_favorites(db: Session, user_id: int, book_id: str):
+def remove_from_favorites(db: Session, user_id: int, book_id: str, book_vector=None):
     favorite = db.query(FavoriteInDB).filter_by(user_id=user_id, book_id=book_id).first()
     if favorite:
         db.delete(favorite)
         db.commit()
+        if book_vector is not None:
+            adjust_taste_vector(db, user_id, book_vector, -1)
+        ids = favorite_sets.get(user_id)
+        if ids is not None:
+            favorite_sets.set(user_id, ids - {str(book_id)})
         return True
     return False
+
+async def create_user_async(db: AsyncSession, email: str, username: str, password: str):
+    db_user = UserInDB(email=email, username=username, password=password)
+    db.add(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    user_count.adjust(1)
+    return db_user
+
+async def get_user_by_username_or_email_async(db: AsyncSession, identifier: str):
+    result = await db.execute(
+        select(UserInDB).where(or_(UserInDB.username == identifier, UserInDB.email == identifier)).limit(1)
+    )
+    return result.scalars().first()
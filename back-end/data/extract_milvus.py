@@ -1,4 +1,5 @@
 from pymilvus import connections, Collection
+import numpy as np
 import pandas as pd
 
 connections.connect(alias="default", uri="YOUR_MILVUS_DOMAIN")
@@ -11,13 +12,17 @@ n = collection.num_entities
 results = collection.query(
     expr="",
     output_fields=["id","title","description","thumbnail",
-                   "author","publisher","publishing_year","num_pages","language","categories","link"
+                   "author","publisher","publishing_year","num_pages","language","categories","link","vector"
     ],
     limit = n
 )
 
 df = pd.DataFrame(results)
 
+# Row i of milvus_vectors.npy is the embedding of row i of milvus_books.csv;
+# vector_store.LocalVectorStore memory-maps the pair.
+np.save("milvus_vectors.npy", np.asarray(df.pop("vector").tolist(), dtype=np.float32))
+
 df.to_csv("milvus_books.csv", index=False, encoding="utf-8-sig")
 
 print("done")
@@ -0,0 +1,119 @@
+import argparse
+import json
+import sqlite3
+import time
+import numpy as np
+import pandas as pd
+from pymilvus import connections, utility, Collection, CollectionSchema, FieldSchema, DataType
+from milvus_index import index_params, search_params, search_params_for, rebuild_index
+
+milvus_uri = "YOUR_MILVUS_DOMAIN"
+
+# (index type, build params, search params to sweep)
+DEFAULT_CONFIGS = [
+    ("FLAT", {}, [{}]),
+    ("IVF_FLAT", {"nlist": 256}, [{"nprobe": n} for n in (4, 8, 16, 32)]),
+    ("IVF_FLAT", {"nlist": 1024}, [{"nprobe": n} for n in (8, 16, 32, 64)]),
+    ("IVF_SQ8", {"nlist": 1024}, [{"nprobe": n} for n in (8, 16, 32, 64)]),
+    ("HNSW", {"M": 16, "efConstruction": 200}, [{"ef": n} for n in (32, 64, 128, 256)]),
+    ("HNSW", {"M": 32, "efConstruction": 200}, [{"ef": n} for n in (32, 64, 128)]),
+]
+
+def load_queries(matrix, db_path, count, seed):
+    if db_path:
+        rows = sqlite3.connect(db_path).execute("SELECT vector FROM query_embeddings LIMIT ?", (count,)).fetchall()
+        return np.stack([np.frombuffer(row[0], dtype=np.float32) for row in rows])
+    rng = np.random.default_rng(seed)
+    return np.asarray(matrix[rng.choice(len(matrix), min(count, len(matrix)), replace=False)])
+
+def exact_top_k(matrix, queries, k, step=65536):
+    scores = np.empty((len(queries), len(matrix)), dtype=np.float32)
+    for start in range(0, len(matrix), step):
+        scores[:, start:start + step] = queries @ np.asarray(matrix[start:start + step]).T
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return [set(row.tolist()) for row in top]
+
+def create_scratch_collection(name, matrix, batch_size=5000):
+    if utility.has_collection(name):
+        utility.drop_collection(name)
+    schema = CollectionSchema([
+        FieldSchema("id", DataType.INT64, is_primary=True),
+        FieldSchema("vector", DataType.FLOAT_VECTOR, dim=matrix.shape[1]),
+    ])
+    collection = Collection(name, schema)
+    for start in range(0, len(matrix), batch_size):
+        part = np.asarray(matrix[start:start + batch_size])
+        collection.insert([list(range(start, start + len(part))), part.tolist()])
+    collection.flush()
+    return collection
+
+def loaded_memory(name):
+    return sum(segment.mem_size for segment in utility.get_query_segment_info(name))
+
+def run_searches(collection, queries, truth, k, params):
+    params = search_params_for(params, k)
+    latencies = []
+    recalls = []
+    for query, expected in zip(queries, truth):
+        started = time.perf_counter()
+        hits = collection.search(data=[query.tolist()], anns_field="vector", param=params, limit=k)[0]
+        latencies.append((time.perf_counter() - started) * 1000)
+        recalls.append(len(expected & {hit.id for hit in hits}) / k)
+    return np.mean(recalls), np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure recall@k, latency and memory of Milvus index configurations.")
+    parser.add_argument("--vectors", default="../milvus_vectors.npy", help="matrix written by extract_milvus.py")
+    parser.add_argument("--queries", help="QUERY_EMBEDDING_CACHE_DB to replay real queries (default: sampled rows)")
+    parser.add_argument("--num-queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--configs", help="JSON file of [index_type, build_params, [search_params, ...]] entries")
+    parser.add_argument("--collection", default="books_index_benchmark", help="scratch collection, dropped afterwards")
+    parser.add_argument("--output", default="index_benchmark.csv")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    configs = DEFAULT_CONFIGS
+    if args.configs:
+        with open(args.configs) as f:
+            configs = json.load(f)
+
+    matrix = np.load(args.vectors, mmap_mode="r")
+    queries = load_queries(matrix, args.queries, args.num_queries, args.seed)
+    print(f"{len(matrix)} vectors x {matrix.shape[1]} dims, {len(queries)} queries, k={args.k}")
+    truth = exact_top_k(matrix, queries, args.k)
+
+    connections.connect(alias="default", uri=milvus_uri)
+    collection = create_scratch_collection(args.collection, matrix)
+    results = []
+    try:
+        for kind, build, sweeps in configs:
+            started = time.perf_counter()
+            rebuild_index(collection, index_params(kind, build))
+            build_seconds = time.perf_counter() - started
+            memory_mb = loaded_memory(args.collection) / 2 ** 20
+            for search in sweeps:
+                recall, p50, p99 = run_searches(collection, queries, truth, args.k, search_params(kind, search))
+                results.append({
+                    "index_type": kind,
+                    "build_params": json.dumps(build),
+                    "search_params": json.dumps(search),
+                    f"recall@{args.k}": round(recall, 4),
+                    "p50_ms": round(p50, 2),
+                    "p99_ms": round(p99, 2),
+                    "memory_mb": round(memory_mb, 1),
+                    "build_s": round(build_seconds, 1),
+                })
+                print(results[-1])
+    finally:
+        collection.release()
+        utility.drop_collection(args.collection)
+
+    table = pd.DataFrame(results)
+    table.to_csv(args.output, index=False)
+    print(table.to_string(index=False))
+    print(f"Saved to {args.output}. Apply a choice with MILVUS_INDEX_TYPE/MILVUS_INDEX_PARAMS/MILVUS_SEARCH_PARAMS "
+          "and `python embedding_store.py --reindex`.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# On-disk document embedding cache for the ingestion scripts. The query path does not
+# use it: it is keyed on book text, which a search query never matches. Vectors live in an append-only float32 file that is read through np.memmap, and a
+# SQLite index maps sha256(text) to a row. Each embedding model gets its own directory,
+# so a key is effectively (model, text hash).
+class EmbeddingCache:
+    def __init__(self, directory, model):
+        self.model = model
+        self.path = os.path.join(directory, re.sub(r"[^A-Za-z0-9_.-]", "_", model))
+        self.vectors_path = os.path.join(self.path, "vectors.f32")
+        os.makedirs(self.path, exist_ok=True)
+        self.index = sqlite3.connect(os.path.join(self.path, "keys.sqlite3"), check_same_thread=False)
+        self.index.execute("CREATE TABLE IF NOT EXISTS keys (hash TEXT PRIMARY KEY, row INTEGER NOT NULL)")
+        self.index.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self.index.commit()
+        dim = self.index.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+        self.dim = int(dim[0]) if dim else None
+        self.hits = 0
+        self.misses = 0
+        self._matrix = None
+        self._rows = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(text: str):
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _remap(self):
+        size = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+        rows = size // (4 * self.dim)
+        if rows != self._rows:
+            self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+            self._rows = rows
+
+    def get_many(self, texts):
+        keys = [self.key(t) for t in texts]
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                found.update(self.index.execute(
+                    f"SELECT hash, row FROM keys WHERE hash IN ({','.join('?' * len(part))})", part
+                ).fetchall())
+            if found and max(found.values()) >= self._rows:
+                self._remap()
+            vectors = []
+            for key in keys:
+                row = found.get(key)
+                vectors.append(np.array(self._matrix[row]) if row is not None and row < self._rows else None)
+            hits = sum(v is not None for v in vectors)
+            self.hits += hits
+            self.misses += len(vectors) - hits
+        return vectors
+
+    def get(self, text: str):
+        return self.get_many([text])[0]
+
+    def put_many(self, texts, vectors):
+        if not texts:
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self.index.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('dim', ?)", (str(self.dim),))
+            if vectors.shape[1] != self.dim:
+                raise ValueError(f"Expected {self.dim}-dimensional vectors for {self.model}, got {vectors.shape[1]}")
+
+            new = {}
+            for text, vector in zip(texts, vectors):
+                new.setdefault(self.key(text), vector)
+            existing = set()
+            keys = list(new)
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                existing.update(row[0] for row in self.index.execute(
+                    f"SELECT hash FROM keys WHERE hash IN ({','.join('?' * len(part))})", part
+                ))
+            keys = [k for k in keys if k not in existing]
+            if not keys:
+                return
+
+            # Vectors are appended before their keys are committed, so a crash can only
+            # leave unreferenced rows behind, never a key pointing at missing data. A
+            # crash mid-write can also leave a partial row at the end; it is cut off so
+            # the new rows start exactly where their keys say.
+            row_bytes = 4 * self.dim
+            with open(self.vectors_path, "ab") as f:
+                size = f.seek(0, os.SEEK_END)
+                if size % row_bytes:
+                    size = f.truncate(size - size % row_bytes)
+                start = size // row_bytes
+                f.write(np.stack([new[k] for k in keys]).tobytes())
+            self.index.executemany(
+                "INSERT INTO keys (hash, row) VALUES (?, ?)", [(k, start + i) for i, k in enumerate(keys)]
+            )
+            self.index.commit()
+
+    def stats(self):
+        return {"model": self.model, "rows": self._rows, "hits": self.hits, "misses": self.misses}
+
+# LangChain Embeddings wrapper that answers from the cache and only sends misses to
+# the wrapped model, for scripts that hand an embedding function to the vector store.
+class CachedEmbeddings(Embeddings):
+    def __init__(self, embeddings, cache):
+        self.embeddings = embeddings
+        self.cache = cache
+
+    def embed_documents(self, texts):
+        vectors = self.cache.get_many(texts)
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if missing:
+            embedded = self.embeddings.embed_documents([texts[i] for i in missing])
+            self.cache.put_many([texts[i] for i in missing], embedded)
+            for i, vector in zip(missing, embedded):
+                vectors[i] = vector
+        return [list(map(float, v)) for v in vectors]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
@@ -1,18 +1,39 @@
+import argparse
+import asyncio
+import getpass
+import hashlib
 import os
+import random
+import sqlite3
+import time
 import pandas as pd
-from langchain_core.documents import Document
 from langchain_milvus import Milvus
 from langchain_openai import OpenAIEmbeddings
+from openai import AsyncOpenAI, APIConnectionError, APIStatusError, RateLimitError
 from tqdm import tqdm
-import getpass
+from embedding_cache import EmbeddingCache
+from milvus_index import index_params, rebuild_index, create_scalar_indexes
 
 if not os.environ.get("OPENAI_API_KEY"):
     os.environ["OPENAI_API_KEY"] = getpass.getpass("YOUR_OPENAI_API_KEY")
 
 csv_path = "../dataset/new/books_full.csv"
-df = pd.read_csv(csv_path)
+collection_name = "books_dataset"
+milvus_uri = "YOUR_MILVUS_DOMAIN"
+embedding_model_name = "text-embedding-ada-002"
+
+chunk_size = 2000           # CSV rows read per chunk
+embed_batch_size = 256      # texts per embeddings request
+embed_concurrency = int(os.environ.get("EMBED_CONCURRENCY", 8))
+tokens_per_minute = int(os.environ.get("EMBED_TOKENS_PER_MINUTE", 1_000_000))
+max_attempts = 6
+insert_queue_size = 16      # embedded batches waiting for Milvus
 
-df.fillna({
+checkpoint_path = "ingest_state.sqlite3"
+embedding_cache_dir = os.environ.get("DOC_EMBEDDING_CACHE_DIR", "embedding_cache")
+legacy_processed_path = "processed_ids.txt"
+
+FILL_VALUES = {
     "title": "",
     "description": "",
     "thumbnail": "",
@@ -23,79 +44,259 @@ df.fillna({
     "language": "",
     "categories": "",
     "link": ""
-}, inplace=True)
+}
 
-df["publishing_year"] = pd.to_numeric(df["publishing_year"], errors="coerce").fillna(0).astype(int)
-df["num_pages"] = pd.to_numeric(df["num_pages"], errors="coerce").fillna(0).astype(int)
-df["id"] = pd.to_numeric(df["id"], errors="coerce").astype(int)
-df.reset_index(drop=True, inplace=True)
+def prepare_chunk(df):
+    df = df.fillna(FILL_VALUES)
+    df["publishing_year"] = pd.to_numeric(df["publishing_year"], errors="coerce").fillna(0).astype(int)
+    df["num_pages"] = pd.to_numeric(df["num_pages"], errors="coerce").fillna(0).astype(int)
+    df["id"] = pd.to_numeric(df["id"], errors="coerce")
+    df = df.dropna(subset=["id"])
+    df["id"] = df["id"].astype(int)
+    return df.reset_index(drop=True)
 
-processed_path = "processed_ids.txt"
-processed_ids = set()
-if os.path.exists(processed_path):
-    with open(processed_path, "r") as f:
-        processed_ids = set(int(line.strip()) for line in f.readlines())
+def book_text(row):
+    return f"{row['title']} {row['description']} {row['author']} {row['categories']}"
 
-embedding_model = OpenAIEmbeddings(model="text-embedding-ada-002")
+def text_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
 
-collection_name = "books_dataset"
-vectorstore = Milvus(
-    embedding_function=embedding_model,
-    connection_args={"uri": "YOUR_MILVUS_DOMAIN"},
-    collection_name=collection_name,
-    primary_field="id",
-    vector_field="vector",
-    text_field="page_content",
-    auto_id=False,
-    index_params={
-        "metric_type": "IP",
-        "index_type": "IVF_FLAT",
-        "params": {"nlist": 1024}
-    },
-    consistency_level="Strong"
-)
-
-docs = []
-batch_size = 100
-total = len(df)
-
-with open(processed_path, "a") as done_file:
-    for i, row in tqdm(df.iterrows(), total=total, desc="Processing books"):
-        book_id = int(row["id"])
-        if book_id in processed_ids:
-            continue
-
-        text_to_embed = f"{row['title']} {row['description']} {row['author']} {row['categories']}"
-        doc = Document(
-            page_content=text_to_embed,
-            id=book_id,
-            metadata={
-                "title": row["title"],
-                "author": row["author"],
-                "description": row["description"],
-                "categories": row["categories"],
-                "publisher": row["publisher"],
-                "publishing_year": row["publishing_year"],
-                "num_pages": row["num_pages"],
-                "language": row["language"],
-                "thumbnail": row["thumbnail"],
-                "link": row["link"]
-            }
-        )
-        docs.append(doc)
-
-        if len(docs) >= batch_size:
-            vectorstore.add_documents(docs, ids=[d.id for d in docs])
-            for d in docs:
-                done_file.write(f"{d.id}\n")
-            done_file.flush()
-            print(f"Uploaded batch of {len(docs)} books")
-            docs = []
-
-    if docs:
-        vectorstore.add_documents(docs, ids=[d.id for d in docs])
-        for d in docs:
-            done_file.write(f"{d.id}\n")
-        print(f"Uploaded final batch of {len(docs)} books")
-
-print("Done embedding and storing to Milvus.")
+def book_metadata(row):
+    return {
+        "title": row["title"],
+        "author": row["author"],
+        "description": row["description"],
+        "categories": row["categories"],
+        "publisher": row["publisher"],
+        "publishing_year": int(row["publishing_year"]),
+        "num_pages": int(row["num_pages"]),
+        "language": row["language"],
+        "thumbnail": row["thumbnail"],
+        "link": row["link"]
+    }
+
+# Ids already stored in Milvus with the hash of the text they were embedded from, kept
+# in SQLite so a restart only looks up the ids of the chunk at hand instead of reading
+# every processed id back into memory.
+class Checkpoint:
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS processed (id INTEGER PRIMARY KEY, text_hash TEXT)")
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(processed)")}
+        if "text_hash" not in columns:
+            self.db.execute("ALTER TABLE processed ADD COLUMN text_hash TEXT")
+        self.db.execute("CREATE TEMP TABLE seen (id INTEGER PRIMARY KEY)")
+        self.db.commit()
+
+    def import_legacy(self, path):
+        if not os.path.exists(path) or self.db.execute("SELECT 1 FROM processed LIMIT 1").fetchone():
+            return
+        with open(path, "r") as f:
+            ids = [(int(line),) for line in f if line.strip()]
+        self.db.executemany("INSERT OR IGNORE INTO processed (id) VALUES (?)", ids)
+        self.db.commit()
+        print(f"Imported {len(ids)} ids from {path}")
+
+    def processed(self, ids):
+        # id -> stored hash (None for ids checkpointed before hashes were recorded).
+        done = {}
+        for i in range(0, len(ids), 500):
+            part = ids[i:i + 500]
+            rows = self.db.execute(
+                f"SELECT id, text_hash FROM processed WHERE id IN ({','.join('?' * len(part))})", part
+            ).fetchall()
+            done.update(rows)
+        return done
+
+    def mark(self, ids, hashes):
+        self.db.executemany("INSERT OR REPLACE INTO processed (id, text_hash) VALUES (?, ?)", list(zip(ids, hashes)))
+        self.db.commit()
+
+    def see(self, ids):
+        self.db.executemany("INSERT OR IGNORE INTO seen (id) VALUES (?)", [(i,) for i in ids])
+
+    def unseen(self):
+        return [row[0] for row in self.db.execute("SELECT id FROM processed WHERE id NOT IN (SELECT id FROM seen)")]
+
+    def forget(self, ids):
+        self.db.executemany("DELETE FROM processed WHERE id = ?", [(i,) for i in ids])
+        self.db.commit()
+
+# Token bucket over an estimated token count (~4 characters per token), so concurrent
+# batches stay under the account's tokens-per-minute limit instead of hitting 429s.
+class TokenRateLimiter:
+    def __init__(self, tokens_per_minute):
+        self.rate = tokens_per_minute / 60
+        self.capacity = tokens_per_minute
+        self.tokens = tokens_per_minute
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self, tokens):
+        tokens = min(tokens, self.capacity)
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+async def request_embeddings(client, limiter, texts):
+    await limiter.acquire(sum(len(t) for t in texts) // 4 + len(texts))
+    for attempt in range(1, max_attempts + 1):
+        try:
+            res = await client.embeddings.create(model=embedding_model_name, input=texts)
+            return [item.embedding for item in sorted(res.data, key=lambda d: d.index)]
+        except (RateLimitError, APIConnectionError, APIStatusError) as e:
+            if isinstance(e, APIStatusError) and e.status_code < 500 and not isinstance(e, RateLimitError):
+                raise
+            if attempt == max_attempts:
+                raise
+            delay = min(60, 2 ** attempt) * random.uniform(0.5, 1.5)
+            print(f"Embedding batch failed ({e.__class__.__name__}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+# Texts already in the embedding cache (e.g. from an earlier build of any collection)
+# cost no API call.
+async def embed_texts(client, limiter, cache, texts):
+    vectors = cache.get_many(texts)
+    missing = [i for i, v in enumerate(vectors) if v is None]
+    if missing:
+        embedded = await request_embeddings(client, limiter, [texts[i] for i in missing])
+        cache.put_many([texts[i] for i in missing], embedded)
+        for i, vector in zip(missing, embedded):
+            vectors[i] = vector
+    return [list(map(float, v)) for v in vectors]
+
+async def main(sync=False):
+    checkpoint = Checkpoint(checkpoint_path)
+    checkpoint.import_legacy(legacy_processed_path)
+
+    vectorstore = Milvus(
+        embedding_function=OpenAIEmbeddings(model=embedding_model_name),
+        connection_args={"uri": milvus_uri},
+        collection_name=collection_name,
+        primary_field="id",
+        vector_field="vector",
+        text_field="page_content",
+        auto_id=False,
+        index_params=index_params(),
+        consistency_level="Strong"
+    )
+
+    # The SDK's own retries are off; embed_texts backs off with jitter itself.
+    client = AsyncOpenAI(max_retries=0)
+    limiter = TokenRateLimiter(tokens_per_minute)
+    cache = EmbeddingCache(embedding_cache_dir, embedding_model_name)
+    semaphore = asyncio.Semaphore(embed_concurrency)
+    inserts = asyncio.Queue(maxsize=insert_queue_size)
+    progress = tqdm(desc="Embedding books", unit="book")
+
+    # A single consumer writes to Milvus while the next batches are being embedded.
+    async def insert_worker():
+        while True:
+            item = await inserts.get()
+            if item is None:
+                return
+            ids, texts, hashes, vectors, metadatas, replaced = item
+            if replaced:
+                await asyncio.to_thread(vectorstore.delete, ids=[str(i) for i in replaced])
+            await asyncio.to_thread(
+                vectorstore.add_embeddings, texts, vectors, metadatas, ids=[str(i) for i in ids]
+            )
+            checkpoint.mark(ids, hashes)
+            progress.update(len(ids))
+
+    async def embed_batch(batch, stored):
+        ids = batch["id"].tolist()
+        texts = [book_text(row) for _, row in batch.iterrows()]
+        hashes = [text_hash(t) for t in texts]
+        metadatas = [book_metadata(row) for _, row in batch.iterrows()]
+        replaced = [i for i in ids if i in stored]
+        async with semaphore:
+            vectors = await embed_texts(client, limiter, cache, texts)
+        await inserts.put((ids, texts, hashes, vectors, metadatas, replaced))
+
+    inserter = asyncio.create_task(insert_worker())
+    pending = set()
+
+    # Waits until at most `limit` batches are in flight. The insert worker is watched too,
+    # so a failed Milvus write stops the run instead of leaving batches blocked on the queue.
+    async def drain(limit):
+        nonlocal pending
+        while len(pending) > limit:
+            finished, pending = await asyncio.wait(pending | {inserter}, return_when=asyncio.FIRST_COMPLETED)
+            pending.discard(inserter)
+            for task in finished:
+                task.result()
+
+    skipped = 0
+    try:
+        for chunk in pd.read_csv(csv_path, chunksize=chunk_size):
+            chunk = prepare_chunk(chunk)
+            ids = chunk["id"].tolist()
+            stored = checkpoint.processed(ids)
+            if sync:
+                # Only rows whose embedded text changed (or that are new) are embedded again.
+                checkpoint.see(ids)
+                hashes = [text_hash(book_text(row)) for _, row in chunk.iterrows()]
+                changed = [stored.get(i, "") != h for i, h in zip(ids, hashes)]
+                skipped += len(chunk) - sum(changed)
+                chunk = chunk[changed]
+                changed_ids = set(chunk["id"])
+                stored = {i: h for i, h in stored.items() if i in changed_ids}
+            else:
+                skipped += len(stored)
+                chunk = chunk[~chunk["id"].isin(stored.keys())]
+                stored = {}
+            for i in range(0, len(chunk), embed_batch_size):
+                batch = chunk.iloc[i:i + embed_batch_size]
+                pending.add(asyncio.create_task(embed_batch(batch, stored)))
+                await drain(embed_concurrency * 2)
+        await drain(0)
+    finally:
+        for task in pending:
+            task.cancel()
+        if not inserter.done():
+            await inserts.put(None)
+        await inserter
+        progress.close()
+
+    if sync:
+        removed = checkpoint.unseen()
+        for i in range(0, len(removed), 1000):
+            part = removed[i:i + 1000]
+            vectorstore.delete(ids=[str(book_id) for book_id in part])
+            checkpoint.forget(part)
+        print(f"Removed {len(removed)} books that are no longer in {csv_path}.")
+
+    if vectorstore.col is not None:
+        create_scalar_indexes(vectorstore.col)
+
+    print(f"Done embedding and storing to Milvus ({skipped} books were already up to date).")
+    print(f"Embedding cache: {cache.hits} hits, {cache.misses} misses.")
+
+def reindex():
+    from pymilvus import connections, Collection
+
+    connections.connect(alias="default", uri=milvus_uri)
+    params = index_params()
+    collection = Collection(collection_name)
+    rebuild_index(collection, params)
+    create_scalar_indexes(collection)
+    print(f"Rebuilt the {collection_name} vector index as {params}.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Embed books_full.csv into Milvus.")
+    parser.add_argument("--sync", action="store_true",
+                        help="re-embed only new or changed rows and delete vectors of rows removed from the CSV")
+    parser.add_argument("--reindex", action="store_true",
+                        help="only rebuild the vector index with the MILVUS_INDEX_TYPE/MILVUS_INDEX_PARAMS settings")
+    args = parser.parse_args()
+    if args.reindex:
+        reindex()
+    else:
+        asyncio.run(main(sync=args.sync))
@@ -4,6 +4,7 @@ import pandas as pd
 from langchain_core.documents import Document
 from langchain_milvus import Milvus
 from langchain_openai import OpenAIEmbeddings
+from embedding_cache import EmbeddingCache, CachedEmbeddings
 
 if not os.environ.get("OPENAI_API_KEY"):
     os.environ["OPENAI_API_KEY"] = getpass.getpass("YOUR_OPENAI_API_KEY")
@@ -12,7 +13,11 @@ collection_name = "books_collection"
 
 df = pd.read_csv("/back-end/data/dataset/old/books_ver2.csv")
 
-embedding_model = OpenAIEmbeddings(model="text-embedding-ada-002")
+# Rebuilding the collection (drop_old=True) re-reads identical text from the cache instead of re-embedding it.
+embedding_model = CachedEmbeddings(
+    OpenAIEmbeddings(model="text-embedding-ada-002"),
+    EmbeddingCache(os.environ.get("DOC_EMBEDDING_CACHE_DIR", "embedding_cache"), "text-embedding-ada-002")
+)
 
 df = df.fillna({"subtitle": "", "authors": "", "categories": "", "description": "","thumbnail": "","amazon_link": "",
                 "published_year": 0, "average_rating": 0, "num_pages": 0, "ratings_count": 0})
@@ -0,0 +1,66 @@
+import json
+import os
+
+METRIC_TYPE = "IP"
+
+# index type -> (build params, search params). Override with MILVUS_INDEX_TYPE,
+# MILVUS_INDEX_PARAMS and MILVUS_SEARCH_PARAMS (JSON objects); run
+# benchmark_index.py against an export to pick them for the actual data.
+INDEX_DEFAULTS = {
+    "FLAT": ({}, {}),
+    "IVF_FLAT": ({"nlist": 1024}, {"nprobe": 16}),
+    "IVF_SQ8": ({"nlist": 1024}, {"nprobe": 16}),
+    "HNSW": ({"M": 16, "efConstruction": 200}, {"ef": 64}),
+}
+
+def _env_params(name):
+    value = os.environ.get(name)
+    return json.loads(value) if value else {}
+
+def index_type():
+    value = os.environ.get("MILVUS_INDEX_TYPE", "IVF_FLAT").upper()
+    if value not in INDEX_DEFAULTS:
+        raise ValueError(f"MILVUS_INDEX_TYPE must be one of {', '.join(INDEX_DEFAULTS)}, got {value}")
+    return value
+
+def index_params(kind=None, params=None):
+    kind = kind or index_type()
+    build = {**INDEX_DEFAULTS[kind][0], **(params if params is not None else _env_params("MILVUS_INDEX_PARAMS"))}
+    return {"metric_type": METRIC_TYPE, "index_type": kind, "params": build}
+
+def search_params(kind=None, params=None):
+    kind = kind or index_type()
+    search = {**INDEX_DEFAULTS[kind][1], **(params if params is not None else _env_params("MILVUS_SEARCH_PARAMS"))}
+    return {"metric_type": METRIC_TYPE, "params": search}
+
+# HNSW rejects searches with ef < limit, so deep pages raise ef to k.
+def search_params_for(params, k):
+    if "ef" in params["params"] and params["params"]["ef"] < k:
+        return {**params, "params": {**params["params"], "ef": k}}
+    return params
+
+def rebuild_index(collection, params, field_name="vector"):
+    collection.release()
+    for index in collection.indexes:
+        if index.field_name == field_name:
+            collection.drop_index(index_name=index.index_name)
+    collection.create_index(field_name=field_name, index_params=params)
+    collection.load()
+
+# Scalar indexes for the fields /bookrcm filters on, so the filter expression is
+# evaluated inside the ANN search instead of by scanning every segment. A categories
+# filter compiles to == and `like` on the " / "-joined field (vector_store.milvus_expr),
+# which the INVERTED index answers from its term dictionary.
+SCALAR_INDEXES = {
+    "language": "INVERTED",
+    "categories": "INVERTED",
+    "publishing_year": "STL_SORT",
+    "num_pages": "STL_SORT",
+}
+
+def create_scalar_indexes(collection):
+    indexed = {index.field_name for index in collection.indexes}
+    for field_name, kind in SCALAR_INDEXES.items():
+        if field_name not in indexed:
+            collection.create_index(field_name=field_name, index_params={"index_type": kind},
+                                    index_name=f"{field_name}_idx")
@@ -1,36 +1,300 @@
 from langchain_openai import OpenAIEmbeddings
-from langchain_milvus import Milvus
-from pymilvus import connections, Collection
+from openai_client import openai_pool
+from vector_store import create_vector_store
+from lexical_search import lexical_index
+from collections import OrderedDict
+import asyncio
+import json
+import numpy as np
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
 
-embedding_model = OpenAIEmbeddings(model="text-embedding-ada-002")
+EMBEDDING_MODEL = "text-embedding-ada-002"
+embedding_model = OpenAIEmbeddings(model=EMBEDDING_MODEL)
 
-connections.connect(alias="default", uri="http://127.0.0.1:19530")
-collection_name = "books_dataset"
-collection = Collection(collection_name)
-text_field = "page_content"
+# VECTOR_BACKEND=local serves searches in-process from a Milvus export instead.
+vector_store = create_vector_store(
+    uri=os.environ.get("MILVUS_URI", "http://127.0.0.1:19530"),
+    collection_name=os.environ.get("MILVUS_COLLECTION", "books_dataset")
+)
+
+def normalize_query(query: str):
+    return " ".join(unicodedata.normalize("NFC", query).lower().split())
+
+# Normalized query -> embedding vector. LRU in memory, with an optional SQLite tier
+# so popular queries survive restarts. The SQLite reads and writes have their own
+# lock, and the async path runs them in a worker thread.
+class QueryEmbeddingCache:
+    # Expired rows are swept at most this often instead of on every write.
+    SWEEP_INTERVAL = 3600
+
+    def __init__(self, embed, aembed=None, max_size=2048, ttl=7 * 24 * 3600, db_path=None):
+        self.embed = embed
+        self.aembed = aembed
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._next_sweep = 0
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings "
+                "(query TEXT PRIMARY KEY, vector BLOB NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS query_embeddings_expires_at ON query_embeddings (expires_at)"
+            )
+            self._db.commit()
+
+    def _remember(self, key, vector, expires_at):
+        with self._lock:
+            self._entries[key] = (expires_at, vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def _memory_lookup(self, key, now):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+        return None
+
+    def _disk_lookup(self, key, now):
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT vector, expires_at FROM query_embeddings WHERE query = ?", (key,)
+            ).fetchone()
+        if row and row[1] > now:
+            vector = np.frombuffer(row[0], dtype=np.float32)
+            self._remember(key, vector, row[1])
+            with self._lock:
+                self.disk_hits += 1
+            return vector
+        return None
+
+    def _cached(self, key, disk=True):
+        now = time.time()
+        vector = self._memory_lookup(key, now)
+        if vector is None and disk and self._db is not None:
+            vector = self._disk_lookup(key, now)
+        if vector is None and (disk or self._db is None):
+            with self._lock:
+                self.misses += 1
+        return vector
+
+    def _persist(self, key, vector, expires_at):
+        now = time.time()
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO query_embeddings (query, vector, expires_at) VALUES (?, ?, ?)",
+                (key, vector.tobytes(), expires_at)
+            )
+            if now >= self._next_sweep:
+                self._db.execute("DELETE FROM query_embeddings WHERE expires_at <= ?", (now,))
+                self._next_sweep = now + self.SWEEP_INTERVAL
+            self._db.commit()
+
+    def _store(self, key, vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        expires_at = time.time() + self.ttl
+        self._remember(key, vector, expires_at)
+        return vector, expires_at
+
+    def get(self, query: str):
+        key = normalize_query(query)
+        vector = self._cached(key)
+        if vector is None:
+            vector, expires_at = self._store(key, self.embed(key))
+            if self._db is not None:
+                self._persist(key, vector, expires_at)
+        return vector
+
+    async def aget(self, query: str):
+        key = normalize_query(query)
+        vector = self._cached(key, disk=False)
+        if vector is None and self._db is not None:
+            vector = await asyncio.to_thread(self._cached, key)
+        if vector is None:
+            embedded = await self.aembed(key) if self.aembed else await asyncio.to_thread(self.embed, key)
+            vector, expires_at = self._store(key, embedded)
+            if self._db is not None:
+                await asyncio.to_thread(self._persist, key, vector, expires_at)
+        return vector
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses
+            }
+
+def embed_query(text: str):
+    return embedding_model.embed_query(text)
+
+# The async path goes through the application's shared OpenAI client and its concurrency limit.
+async def aembed_query(text: str):
+    async with openai_pool.slot() as client:
+        res = await client.embeddings.create(model=EMBEDDING_MODEL, input=text)
+    return res.data[0].embedding
 
-vectorstore = Milvus(
-    embedding_function=embedding_model,
-    connection_args={"uri": "http://127.0.0.1:19530"},
-    collection_name=collection_name,
-    text_field="page_content"
+query_embeddings = QueryEmbeddingCache(
+    embed_query,
+    aembed=aembed_query,
+    max_size=int(os.environ.get("QUERY_EMBEDDING_CACHE_SIZE", 2048)),
+    ttl=float(os.environ.get("QUERY_EMBEDDING_CACHE_TTL", 7 * 24 * 3600)),
+    db_path=os.environ.get("QUERY_EMBEDDING_CACHE_DB")
 )
 
-def recommend_books(query: str):
-    total_docs = collection.num_entities
-    results = vectorstore.similarity_search(query, k=total_docs)
-    return [
-        {
-            "id": doc.id,
-            **doc.metadata
-        }
-        for doc in results
-    ]
+# Deepest position a single query can be paged to, whatever the client asks for.
+MAX_RESULTS = 1000
+# Most hits returned by one request.
+MAX_PAGE_SIZE = 100
+# Milvus rejects searches with a larger limit (topk).
+MAX_SEARCH_LIMIT = 16384
+# Minimum number of hits fetched per Milvus search, so the next few pages are served from memory.
+SEARCH_WINDOW = 100
+RESULT_CACHE_SIZE = 256
+RESULT_CACHE_TTL = 300
+# Fuse BM25 hits into the vector ranking and answer exact title/author queries lexically.
+HYBRID_SEARCH = os.environ.get("HYBRID_SEARCH", "1") != "0"
+RRF_K = 60
+
+_ranked_results = OrderedDict()
+_ranked_lock = threading.Lock()
+
+def search_by_vector(vector, k: int, filters=None):
+    return vector_store.search(vector, k, filters)
+
+# Reciprocal-rank fusion: each ranking adds 1 / (RRF_K + rank) to a book's score.
+def fuse_rankings(rankings, k):
+    fused = {}
+    for ranking in rankings:
+        for rank, hit in enumerate(ranking, start=1):
+            entry = fused.setdefault(hit["id"], [0.0, hit])
+            entry[0] += 1 / (RRF_K + rank)
+    ranked = sorted(fused.values(), key=lambda entry: -entry[0])[:k]
+    return [{**hit, "score": score} for score, hit in ranked]
+
+# A query that is exactly a title or author name is answered from the BM25 index
+# alone, skipping the embedding call: those books first, then other lexical hits.
+def lexical_answer(query, k, filters=None):
+    exact = lexical_index.exact_matches(query, filters) if HYBRID_SEARCH else None
+    if not exact:
+        return None
+    seen = {hit["id"] for hit in exact}
+    rest = [hit for hit in lexical_index.search(query, k, filters) if hit["id"] not in seen]
+    return (exact + rest)[:k]
+
+def hybrid_search(query, vector, k, filters=None):
+    hits = search_by_vector(vector, k, filters)
+    if not HYBRID_SEARCH:
+        return hits
+    return fuse_rankings([hits, lexical_index.search(query, k, filters)], k)
+
+# Filtered searches rank a different candidate set, so they get their own cache entry.
+def _result_key(key, filters):
+    if not filters:
+        return key
+    return key + "\x00" + json.dumps(filters, sort_keys=True, ensure_ascii=False)
+
+def _page_bounds(limit: int, offset: int):
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    offset = max(0, offset)
+    return offset, min(offset + limit, MAX_RESULTS)
+
+def _cached_page(key, offset, end):
+    now = time.monotonic()
+    with _ranked_lock:
+        cached = _ranked_results.get(key)
+        if cached and cached[0] <= now:
+            del _ranked_results[key]
+            cached = None
+        if cached:
+            _ranked_results.move_to_end(key)
+
+    # Later pages reuse the ordering of the first search; only search again when the
+    # client pages past what is held and Milvus might still have more.
+    if cached and (len(cached[1]) >= end or cached[2]):
+        return cached[1][offset:end], 0
+
+    k = max(end, SEARCH_WINDOW, 2 * len(cached[1]) if cached else 0)
+    return None, min(k, MAX_RESULTS)
+
+def _store_ranked(key, hits, k):
+    with _ranked_lock:
+        _ranked_results[key] = (time.monotonic() + RESULT_CACHE_TTL, hits, len(hits) < k)
+        _ranked_results.move_to_end(key)
+        while len(_ranked_results) > RESULT_CACHE_SIZE:
+            _ranked_results.popitem(last=False)
+    return hits
+
+def recommend_books(query: str, limit: int = 20, offset: int = 0, filters=None):
+    offset, end = _page_bounds(limit, offset)
+    if offset >= end:
+        return []
+    key = normalize_query(query)
+    result_key = _result_key(key, filters)
+    page, k = _cached_page(result_key, offset, end)
+    if page is not None:
+        return page
+    hits = lexical_answer(key, k, filters)
+    if hits is None:
+        hits = hybrid_search(key, query_embeddings.get(key), k, filters)
+    return _store_ranked(result_key, hits, k)[offset:end]
+
+# Same as recommend_books, but the embedding call is awaited and the BM25 and vector
+# searches run in worker threads, so the event loop is never held up.
+async def arecommend_books(query: str, limit: int = 20, offset: int = 0, filters=None):
+    offset, end = _page_bounds(limit, offset)
+    if offset >= end:
+        return []
+    key = normalize_query(query)
+    result_key = _result_key(key, filters)
+    page, k = _cached_page(result_key, offset, end)
+    if page is not None:
+        return page
+    hits = await asyncio.to_thread(lexical_answer, key, k, filters)
+    if hits is None:
+        vector = await query_embeddings.aget(key)
+        hits = await asyncio.to_thread(hybrid_search, key, vector, k, filters)
+    return _store_ranked(result_key, hits, k)[offset:end]
+
+# "For you" page: nearest books to a user's taste vector, minus the books it was built
+# from. Needs no embedding call, since the vectors come from the store.
+def recommend_for_taste(taste_vector, exclude_ids, limit: int = 20, offset: int = 0, filters=None):
+    offset, end = _page_bounds(limit, offset)
+    norm = np.linalg.norm(taste_vector) if len(taste_vector) else 0
+    if offset >= end or not norm:
+        return []
+    k = min(end + len(exclude_ids), MAX_SEARCH_LIMIT)
+    hits = search_by_vector(taste_vector / norm, k, filters)
+    return [hit for hit in hits if hit["id"] not in exclude_ids][offset:end]
+
+def clear_ranked_results():
+    with _ranked_lock:
+        _ranked_results.clear()
 
 if __name__ == "__main__":
     user_query = "teen"
-    top_books = recommend_books(user_query)
+    top_books = recommend_books(user_query, limit=20)
 
     print("\nResult:\n")
     for i, book in enumerate(top_books, 1):
-        print(f"{i}. [{book['id']}] {book.get('title')} by {book.get('author')}")
\ No newline at end of file
+        print(f"{i}. [{book['id']}] {book.get('title')} by {book.get('author')}")
@@ -0,0 +1,153 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+EXPLAIN_MODEL = "gpt-4o-mini"
+
+def explain_messages(title: str, author: str, description: str):
+    prompt = f"""You're a helpful book recommender.
+Title: {title}
+Author(s): {author}
+Description: {description}
+Explain to a reader why they might like this book in 2-3 Vietnamese sentences."""
+    return [
+        {"role": "system", "content": "You're a friendly book expert."},
+        {"role": "user", "content": prompt}
+    ]
+
+async def generate_explanation(client, title: str, author: str, description: str):
+    res = await client.chat.completions.create(
+        model=EXPLAIN_MODEL,
+        messages=explain_messages(title, author, description),
+        temperature=0.7,
+        max_tokens=120
+    )
+    return res.choices[0].message.content.strip(), res.usage
+
+async def stream_explanation(client, title: str, author: str, description: str):
+    stream = await client.chat.completions.create(
+        model=EXPLAIN_MODEL,
+        messages=explain_messages(title, author, description),
+        temperature=0.7,
+        max_tokens=120,
+        stream=True,
+        stream_options={"include_usage": True}
+    )
+    async for chunk in stream:
+        yield chunk
+
+def explanation_key(title: str, author: str, description: str):
+    # The model is part of the key so switching models never serves stale text.
+    payload = json.dumps([EXPLAIN_MODEL, title.strip(), author.strip(), description.strip()], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+# Explanations persisted in SQLite by content hash, with a TTL and least-recently-used
+# eviction once max_entries is reached. Concurrent misses for the same key share one
+# upstream call. Hits only note the access time in memory; those are written in one
+# batch, and expiry/eviction runs every SWEEP_EVERY writes rather than on each one.
+class ExplanationCache:
+    TOUCH_FLUSH_INTERVAL = 30
+    SWEEP_EVERY = 100
+
+    def __init__(self, db_path, ttl=30 * 24 * 3600, max_entries=50000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._inflight = {}
+        self._touched = {}
+        self._next_flush = time.time() + self.TOUCH_FLUSH_INTERVAL
+        self._puts = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS explanations "
+            "(key TEXT PRIMARY KEY, reason TEXT NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS ix_explanations_accessed ON explanations (accessed_at)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS ix_explanations_expires ON explanations (expires_at)")
+        self._db.commit()
+
+    def _flush_touched(self):
+        if self._touched:
+            self._db.executemany(
+                "UPDATE explanations SET accessed_at = ? WHERE key = ?",
+                [(at, key) for key, at in self._touched.items()]
+            )
+            self._touched = {}
+            self._db.commit()
+        self._next_flush = time.time() + self.TOUCH_FLUSH_INTERVAL
+
+    def _sweep(self, now):
+        self._db.execute("DELETE FROM explanations WHERE expires_at <= ?", (now,))
+        size = self._db.execute("SELECT COUNT(*) FROM explanations").fetchone()[0]
+        if size > self.max_entries:
+            self._db.execute(
+                "DELETE FROM explanations WHERE key IN "
+                "(SELECT key FROM explanations ORDER BY accessed_at LIMIT ?)",
+                (size - self.max_entries,)
+            )
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT reason, expires_at FROM explanations WHERE key = ?", (key,)).fetchone()
+            if row is None or row[1] <= now:
+                self.misses += 1
+                return None
+            self._touched[key] = now
+            if now >= self._next_flush:
+                self._flush_touched()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, reason):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO explanations (key, reason, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, reason, now + self.ttl, now)
+            )
+            self._touched.pop(key, None)
+            self._puts += 1
+            if self._puts % self.SWEEP_EVERY == 0:
+                self._flush_touched()
+                self._sweep(now)
+            self._db.commit()
+
+    async def aget(self, key):
+        return await asyncio.to_thread(self.get, key)
+
+    async def aput(self, key, reason):
+        await asyncio.to_thread(self.put, key, reason)
+
+    async def get_or_create(self, key, produce):
+        reason = await self.aget(key)
+        if reason is not None:
+            return reason
+
+        task = self._inflight.get(key)
+        if task is None:
+            async def run():
+                try:
+                    created = await produce()
+                    await self.aput(key, created)
+                    return created
+                finally:
+                    self._inflight.pop(key, None)
+            task = asyncio.ensure_future(run())
+            self._inflight[key] = task
+        else:
+            self.coalesced += 1
+        # Shielded so a client disconnecting does not cancel the call other requests wait on.
+        return await asyncio.shield(task)
+
+    def stats(self):
+        with self._lock:
+            size = self._db.execute("SELECT COUNT(*) FROM explanations").fetchone()[0]
+        return {"size": size, "max_entries": self.max_entries, "hits": self.hits,
+                "misses": self.misses, "coalesced": self.coalesced, "in_flight": len(self._inflight)}
@@ -0,0 +1,133 @@
+from books import BOOK_FIELDS, METADATA_FIELDS, book_columns, deleted_books
+from text_folding import tokenize
+from vector_store import filter_mask, plain_value
+from collections import defaultdict
+import threading
+import numpy as np
+import pandas as pd
+
+# Title and author hits count for more than a word buried in a description.
+FIELD_WEIGHTS = {"title": 3.0, "author": 2.0, "categories": 1.0, "description": 1.0}
+BM25_K1 = 1.2
+BM25_B = 0.75
+# An exact title/author match is only trusted for queries of at least this many
+# distinct words, and only when at least this share of the books containing all of
+# them are such matches, so one common word that happens to be a title is not enough.
+EXACT_MIN_TOKENS = 2
+EXACT_MIN_SHARE = 0.5
+
+# BM25 over the weighted title/author/categories/description text of each book. The
+# length-normalised term weights are precomputed, so a query is a few array adds.
+class BM25Corpus:
+    def __init__(self, frame):
+        self.ids, self.columns = book_columns(frame)
+        self.positions = {book_id: i for i, book_id in enumerate(self.ids)}
+        self.alive = np.ones(len(self.ids), dtype=bool)
+        self.deleted_version = None
+
+        frequencies = defaultdict(lambda: defaultdict(float))
+        lengths = np.zeros(len(self.ids), dtype=np.float32)
+        for field, weight in FIELD_WEIGHTS.items():
+            for doc, value in enumerate(self.columns[field]):
+                tokens = tokenize(value)
+                lengths[doc] += weight * len(tokens)
+                for token in tokens:
+                    frequencies[token][doc] += weight
+        average = lengths.mean() if len(lengths) else 0
+        norms = BM25_K1 * (1 - BM25_B + BM25_B * lengths / (average or 1))
+
+        self.postings = {}
+        for token, docs in frequencies.items():
+            rows = np.fromiter(docs.keys(), dtype=np.int32, count=len(docs))
+            tf = np.fromiter(docs.values(), dtype=np.float32, count=len(docs))
+            idf = np.log(1 + (len(self.ids) - len(rows) + 0.5) / (len(rows) + 0.5))
+            self.postings[token] = (rows, (idf * tf * (BM25_K1 + 1) / (tf + norms[rows])).astype(np.float32))
+
+        # Full titles and author names as token strings, for recognising exact-match queries.
+        self.exact = defaultdict(list)
+        for field in ("title", "author"):
+            for doc, value in enumerate(self.columns[field]):
+                key = " ".join(tokenize(value))
+                if key:
+                    self.exact[key].append(doc)
+
+    def scores(self, query):
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for token in set(tokenize(query)):
+            posting = self.postings.get(token)
+            if posting is not None:
+                scores[posting[0]] += posting[1]
+        return scores
+
+    # Number of books containing every one of the tokens.
+    def cooccurrences(self, tokens):
+        rows = None
+        for token in tokens:
+            posting = self.postings.get(token)
+            if posting is None:
+                return 0
+            rows = posting[0] if rows is None else np.intersect1d(rows, posting[0], assume_unique=True)
+        return len(rows) if rows is not None else 0
+
+    def hit(self, doc, score):
+        return {"id": str(self.ids[doc]), "score": float(score),
+                **{f: plain_value(self.columns[f][doc]) for f in METADATA_FIELDS}}
+
+# Serves queries from the current corpus and swaps in a new one when the book metadata
+# is reloaded. Deleted books are hidden through the shared tombstone file, so they
+# stay out of results after a restart or a rebuild.
+class BM25Index:
+    def __init__(self, frame=None, tombstones=deleted_books):
+        self.tombstones = tombstones
+        self._lock = threading.Lock()
+        self.corpus = BM25Corpus(frame if frame is not None else pd.DataFrame(columns=BOOK_FIELDS))
+
+    def rebuild(self, frame):
+        self.corpus = BM25Corpus(frame)
+
+    # The current corpus, with deletions made since it last served a query applied.
+    def _current(self):
+        corpus = self.corpus
+        corpus.deleted_version = self.tombstones.apply(corpus.positions, corpus.alive, corpus.deleted_version, self._lock)
+        return corpus
+
+    def search(self, query, k, filters=None):
+        corpus = self._current()
+        scores = corpus.scores(query)
+        with self._lock:
+            mask = filter_mask(corpus.alive & (scores > 0), corpus.ids, corpus.columns, filters)
+        rows = np.flatnonzero(mask)
+        if not len(rows) or k <= 0:
+            return []
+        k = min(k, len(rows))
+        top = rows[np.argpartition(-scores[rows], k - 1)[:k]]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [corpus.hit(doc, scores[doc]) for doc in top]
+
+    # Books whose whole title or author name is the query, best BM25 first; None
+    # when the query is not confidently an exact title/author.
+    def exact_matches(self, query, filters=None):
+        corpus = self._current()
+        tokens = tokenize(query)
+        if len(set(tokens)) < EXACT_MIN_TOKENS:
+            return None
+        docs = corpus.exact.get(" ".join(tokens))
+        if not docs:
+            return None
+        docs = np.unique(np.asarray(docs, dtype=np.int64))
+        if len(docs) < EXACT_MIN_SHARE * corpus.cooccurrences(set(tokens)):
+            return None
+        with self._lock:
+            mask = filter_mask(corpus.alive[docs], corpus.ids[docs],
+                               {f: c[docs] for f, c in corpus.columns.items()}, filters)
+        docs = docs[mask]
+        scores = corpus.scores(query)
+        docs = docs[np.argsort(-scores[docs], kind="stable")]
+        return [corpus.hit(doc, scores[doc]) for doc in docs]
+
+    def discard(self, book_id):
+        self.tombstones.add([book_id])
+        self._current()
+
+# Empty until main.py builds it from the book metadata store.
+lexical_index = BM25Index()
@@ -1,32 +1,69 @@
-from fastapi import FastAPI, Query, HTTPException, Depends
+from fastapi import FastAPI, Query, HTTPException, Depends, Response
+from fastapi.responses import StreamingResponse, JSONResponse
 from sqlalchemy.orm import Session
-from passlib.context import CryptContext
-from crud import create_user, get_user_by_username_or_email, add_to_favorites, is_favorites, remove_from_favorites
-from userdb import get_db, SessionLocal
-from model import RegisterUser, User, Favorite, TokenData, UserInDB, FavoriteInDB, AdminInDB
-from data.openai.query import recommend_books
+from sqlalchemy.ext.asyncio import AsyncSession
+from crud import create_user_async, get_user_by_username_or_email_async, add_to_favorites, is_favorites, remove_from_favorites, get_favorite_ids, favorite_sets, list_users_async, user_count, get_taste_vector, save_taste_vector, has_taste_vector
+from userdb import get_db, get_async_db, async_session_scope
+from model import RegisterUser, User, Favorite, FavoriteStatusRequest, TokenData, UserInDB, FavoriteInDB, AdminInDB, TokenUsageRollup, UserTasteVector
+from data.openai.query import arecommend_books, recommend_for_taste, query_embeddings, clear_ranked_results, vector_store, MAX_RESULTS, MAX_PAGE_SIZE
 from pydantic import BaseModel
-from openai import AsyncOpenAI
+from openai_client import openai_pool
 from fastapi.middleware.cors import CORSMiddleware
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from fastapi.security import OAuth2PasswordBearer
+from contextlib import asynccontextmanager
 from suggest_words import fetch_book_suggestions
-from sqlalchemy import or_, text
-from pymilvus import connections, Collection
+from books import BookStore
+from lexical_search import lexical_index
+from usage_recorder import UsageRecorder, bucket_range
+from ttl_cache import TTLCache
+from password_hashing import PasswordHasher, HasherBusy
+from explanations import ExplanationCache, explanation_key, generate_explanation, stream_explanation
+from sqlalchemy import or_, select, func, text, delete
 import os
+import json
+import asyncio
 import getpass
 
-app = FastAPI()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+usage_recorder = UsageRecorder(async_session_scope)
+password_hasher = PasswordHasher()
+explanation_cache = ExplanationCache(
+    os.environ.get("EXPLAIN_CACHE_DB", "./explanations.sqlite3"),
+    ttl=float(os.environ.get("EXPLAIN_CACHE_TTL", 30 * 24 * 3600)),
+    max_entries=int(os.environ.get("EXPLAIN_CACHE_SIZE", 50000))
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await usage_recorder.start()
+    openai_pool.open()
+    password_hasher.start()
+    yield
+    await usage_recorder.stop()
+    await openai_pool.aclose()
+    password_hasher.shutdown()
+
+app = FastAPI(lifespan=lifespan)
+
+@app.exception_handler(HasherBusy)
+async def hasher_busy_handler(request, exc):
+    return JSONResponse(status_code=429, content={"detail": "Too many login attempts, try again shortly"},
+                        headers={"Retry-After": "1"})
 
 if not os.environ.get("OPENAI_API_KEY"):
     os.environ["OPENAI_API_KEY"] = getpass.getpass("YOUR_OPENAI_API_KEY")
 
-connections.connect(alias = "default", uri = "YOUR_MILVUS_URL")
-milvus_collection = Collection("YOUR_COLLECTION_NAME")
-milvus_collection.load()
-print(" [FastAPI] Milvus contains:", milvus_collection.num_entities, "vectors")
+print(" [FastAPI] Vector store contains:", vector_store.count(), "vectors")
+
+book_store = BookStore(os.environ.get("BOOK_METADATA_PATH", "./data/dataset/new/books_full.csv"))
+print(" [FastAPI] Book metadata store contains:", len(book_store), "books")
+
+def rebuild_lexical_index(frame):
+    lexical_index.rebuild(frame)
+    clear_ranked_results()
+
+book_store.subscribe(rebuild_lexical_index)
 
 app.add_middleware(
     CORSMiddleware,
@@ -36,6 +73,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Total-Count", "X-Next-Cursor"],
 )
 
 SECRET_KEY = "super-secret-key"
@@ -50,7 +88,14 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+# Resolved users/admins keyed by token subject, so authenticated calls skip the lookup
+# query. Entries live for AUTH_CACHE_TTL seconds and are dropped when an account is deleted.
+principal_cache = TTLCache(
+    max_size=int(os.environ.get("AUTH_CACHE_SIZE", 10000)),
+    ttl=float(os.environ.get("AUTH_CACHE_TTL", 60))
+)
+
+async def get_current_user(token: str = Depends(oauth2_scheme)):
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username = payload.get("sub")
@@ -59,12 +104,16 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     except JWTError:
         raise HTTPException(status_code=401, detail="Could not validate credentials")
 
-    user = get_user_by_username_or_email(db, identifier=username)
+    user = principal_cache.get(("user", username))
     if user is None:
-        raise HTTPException(status_code=401, detail="User not found")
+        async with async_session_scope() as db:
+            user = await get_user_by_username_or_email_async(db, identifier=username)
+        if user is None:
+            raise HTTPException(status_code=401, detail="User not found")
+        principal_cache.set(("user", username), user)
     return user
 
-def get_current_admin(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_admin(token: str = Depends(oauth2_scheme)):
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username = payload.get("sub")
@@ -74,31 +123,35 @@ def get_current_admin(token: str = Depends(oauth2_scheme), db: Session = Depends
     except JWTError:
         raise HTTPException(status_code=401, detail="Admin token invalid")
 
-    admin = db.query(AdminInDB).filter(AdminInDB.username == username).first()
-    if not admin:
-        raise HTTPException(status_code=401, detail="Admin not found")
+    admin = principal_cache.get(("admin", username))
+    if admin is None:
+        async with async_session_scope() as db:
+            admin = (await db.execute(select(AdminInDB).where(AdminInDB.username == username).limit(1))).scalars().first()
+        if not admin:
+            raise HTTPException(status_code=401, detail="Admin not found")
+        principal_cache.set(("admin", username), admin)
     return admin
 
 @app.post("/register/")
-def register_user(user: RegisterUser, db: Session = Depends(get_db)):
-    hashed_password = pwd_context.hash(user.password)
-    db_user = create_user(db=db, username=user.username, email=user.email, password=hashed_password)
+async def register_user(user: RegisterUser, db: AsyncSession = Depends(get_async_db)):
+    hashed_password = await password_hasher.hash(user.password)
+    db_user = await create_user_async(db=db, username=user.username, email=user.email, password=hashed_password)
     return {"message": "User created successfully", "user_id": db_user.id}
 
 @app.post("/login/")
-def login_user(user: User, db: Session = Depends(get_db)):
-    db_user = get_user_by_username_or_email(db=db, identifier=user.identifier)
-    if not db_user or not pwd_context.verify(user.password, db_user.password):
+async def login_user(user: User, db: AsyncSession = Depends(get_async_db)):
+    db_user = await get_user_by_username_or_email_async(db=db, identifier=user.identifier)
+    if not db_user or not await password_hasher.verify(user.password, db_user.password):
         raise HTTPException(status_code=400, detail="Invalid credentials")
     access_token = create_access_token(data={"sub": db_user.username})
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.post("/admin/login/")
-def login_admin(user: User, db: Session = Depends(get_db)):
-    db_admin = db.query(AdminInDB).filter(
+async def login_admin(user: User, db: AsyncSession = Depends(get_async_db)):
+    db_admin = (await db.execute(select(AdminInDB).where(
         or_(AdminInDB.username == user.identifier, AdminInDB.email == user.identifier)
-    ).first()
-    if not db_admin or not pwd_context.verify(user.password, db_admin.password):
+    ).limit(1))).scalars().first()
+    if not db_admin or not await password_hasher.verify(user.password, db_admin.password):
         raise HTTPException(status_code=400, detail="Invalid admin credentials")
     token = create_access_token(data={"sub": db_admin.username, "admin": True})
     return {"access_token": token, "token_type": "bearer"}
@@ -111,59 +164,88 @@ def get_user_info(current_user: UserInDB = Depends(get_current_user)):
     }
 
 @app.get("/admin/overview")
-def admin_overview(db: Session = Depends(get_db), current_admin: AdminInDB = Depends(get_current_admin)):
+async def admin_overview(db: AsyncSession = Depends(get_async_db), current_admin: AdminInDB = Depends(get_current_admin)):
     return {
-        "total_users": db.query(UserInDB).count(),
-        "total_favorites": db.query(FavoriteInDB).count(),
-        "total_books": milvus_collection.num_entities
+        "total_users": await user_count.get(db),
+        "total_favorites": await db.scalar(select(func.count()).select_from(FavoriteInDB)),
+        "total_books": len(book_store)
     }
 
-@app.get("/admin/users")
-def list_users(db: Session = Depends(get_db), current_admin: AdminInDB = Depends(get_current_admin)):
-    users = db.query(UserInDB).all()
+@app.get("/admin/cache-stats")
+async def cache_stats(current_admin: AdminInDB = Depends(get_current_admin)):
+    return {
+        "query_embeddings": query_embeddings.stats(),
+        "principals": principal_cache.stats(),
+        "favorite_sets": favorite_sets.stats(),
+        "explanations": explanation_cache.stats(),
+        "usage_recorder": usage_recorder.stats(),
+        "openai": openai_pool.stats(),
+        "password_hasher": password_hasher.stats(),
+        "user_count": user_count.stats()
+    }
+
+def user_page(response: Response, users, limit: int):
+    # Pass X-Next-Cursor back as `after_id` to fetch the next page.
+    if len(users) == limit:
+        response.headers["X-Next-Cursor"] = str(users[-1].id)
     return [{"id": u.id, "username": u.username, "email": u.email} for u in users]
 
+@app.get("/admin/users")
+async def list_users(response: Response, after_id: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=500),
+                     db: AsyncSession = Depends(get_async_db), current_admin: AdminInDB = Depends(get_current_admin)):
+    users = await list_users_async(db, after_id=after_id, limit=limit)
+    response.headers["X-Total-Count"] = str(await user_count.get(db))
+    return user_page(response, users, limit)
+
 @app.get("/admin/users/search")
-def search_users(query: str, db: Session = Depends(get_db), current_admin: AdminInDB = Depends(get_current_admin)):
-    users = db.query(UserInDB).filter(
-        or_(
-            UserInDB.username.ilike(f"%{query}%"),
-            UserInDB.email.ilike(f"%{query}%")
-        )
-    ).all()
-    return [{"id": u.id, "username": u.username, "email": u.email} for u in users]
+async def search_users(response: Response, query: str = "", mode: str = Query("prefix", pattern="^(prefix|substring)$"),
+                       after_id: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=500),
+                       db: AsyncSession = Depends(get_async_db), current_admin: AdminInDB = Depends(get_current_admin)):
+    users = await list_users_async(db, after_id=after_id, limit=limit, query=query.strip(), mode=mode)
+    return user_page(response, users, limit)
 
 @app.delete("/admin/users/{user_id}")
-def delete_user(user_id: int, db: Session = Depends(get_db), current_admin: AdminInDB = Depends(get_current_admin)):
-    user = db.query(UserInDB).filter(UserInDB.id == user_id).first()
+async def delete_user(user_id: int, db: AsyncSession = Depends(get_async_db), current_admin: AdminInDB = Depends(get_current_admin)):
+    user = await db.get(UserInDB, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    db.delete(user)
-    db.commit()
+    await db.execute(delete(UserTasteVector).where(UserTasteVector.user_id == user_id))
+    await db.delete(user)
+    await db.commit()
+    user_count.adjust(-1)
+    principal_cache.pop(("user", user.username))
+    favorite_sets.pop(user.id)
     return {"message": "User deleted"}
 
 @app.get("/admin/books/count")
-def count_books(current_admin: AdminInDB = Depends(get_current_admin)):
-    return {"total_books": milvus_collection.num_entities}
+async def count_books(current_admin: AdminInDB = Depends(get_current_admin)):
+    return {"total_books": len(book_store)}
 
 @app.get("/admin/books/search")
-def search_books(query: str, current_admin: AdminInDB = Depends(get_current_admin)):
-    expr = f'title like "%{query}%" or author like "%{query}%" or categories like "%{query}%"'
-    try:
-        results = milvus_collection.query(
-            expr=expr,
-            output_fields=["id", "title", "author", "categories"],
-            limit=100
-        )
-        return results
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
+async def search_books(response: Response, query: str = "", limit: int = Query(100, ge=1, le=500),
+                       offset: int = Query(0, ge=0), current_admin: AdminInDB = Depends(get_current_admin)):
+    await asyncio.to_thread(book_store.refresh)
+    total, books = await asyncio.to_thread(book_store.search, query, limit=limit, offset=offset)
+    response.headers["X-Total-Count"] = str(total)
+    return books
+
+@app.post("/admin/books/reload")
+async def reload_books(current_admin: AdminInDB = Depends(get_current_admin)):
+    await asyncio.to_thread(book_store.reload)
+    return {"total_books": len(book_store)}
 
 @app.delete("/admin/books/{book_id}")
-def delete_book(book_id: str, current_admin: AdminInDB = Depends(get_current_admin)):
+async def delete_book(book_id: str, current_admin: AdminInDB = Depends(get_current_admin)):
+    if book_id not in book_store:
+        missing = await asyncio.to_thread(vector_store.missing, [book_id])
+        if missing:
+            raise HTTPException(status_code=404, detail="Book not found")
     try:
-        milvus_collection.delete(expr=f'id == "{book_id}"')
-        return {"message": f"Book {book_id} deleted from Milvus"}
+        await asyncio.to_thread(vector_store.delete, [book_id])
+        book_store.discard(book_id)
+        lexical_index.discard(book_id)
+        clear_ranked_results()
+        return {"message": f"Book {book_id} deleted from the vector store"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -171,54 +253,126 @@ def delete_book(book_id: str, current_admin: AdminInDB = Depends(get_current_adm
 def is_favorite(book_id: str, db: Session = Depends(get_db), current_user: UserInDB = Depends(get_current_user)):
     return {"is_favorite": is_favorites(db, current_user.id, book_id)}
 
+@app.post("/favorites/status")
+def favorite_status(request: FavoriteStatusRequest, db: Session = Depends(get_db), current_user: UserInDB = Depends(get_current_user)):
+    favorite_ids = get_favorite_ids(db, current_user.id)
+    return {"favorites": {book_id: book_id in favorite_ids for book_id in request.book_ids}}
+
+@app.get("/admin/users/{user_id}/favorites")
+async def admin_user_favorites(user_id: int, limit: int = Query(50, ge=1, le=500), offset: int = Query(0, ge=0),
+                               db: AsyncSession = Depends(get_async_db), current_admin: AdminInDB = Depends(get_current_admin)):
+    favorites_query = select(FavoriteInDB).where(FavoriteInDB.user_id == user_id)
+    total = await db.scalar(select(func.count()).select_from(favorites_query.subquery()))
+    favorites = (await db.execute(favorites_query.order_by(FavoriteInDB.id).offset(offset).limit(limit))).scalars().all()
+    books, missing = book_store.get_many([fav.book_id for fav in favorites],
+                                         fields=["id", "title", "author", "categories"])
+    return {"favorites": books, "missing": missing, "total": total, "offset": offset, "limit": limit}
+
+def book_vector(book_id):
+    # Only fetched to adjust an existing taste vector, and a failed lookup only skips
+    # that update; either way the vector is rebuilt on the next "for you" request.
+    try:
+        return vector_store.vectors([book_id]).get(str(book_id))
+    except Exception:
+        return None
+
 @app.post("/favorites/")
 def add_favorite(favorite: Favorite, db: Session = Depends(get_db), current_user: UserInDB = Depends(get_current_user)):
-    db_fav = add_to_favorites(db=db, user_id=current_user.id, book_id=favorite.book_id)
+    vector = None
+    if str(favorite.book_id) not in get_favorite_ids(db, current_user.id) and has_taste_vector(db, current_user.id):
+        vector = book_vector(favorite.book_id)
+    db_fav = add_to_favorites(db=db, user_id=current_user.id, book_id=favorite.book_id, book_vector=vector)
     return {"message": "Book added to favorites"}
 
 @app.get("/userfavorites")
-def get_favorites(db: Session = Depends(get_db), current_user: UserInDB = Depends(get_current_user)):
-    favorites = db.query(FavoriteInDB).filter(FavoriteInDB.user_id == current_user.id).all()
-    books = []
-    for fav in favorites:
-        result = milvus_collection.query(
-            expr=f'id == "{fav.book_id}"',
-            output_fields=["id", "title", "author", "publishing_year", "thumbnail",
-                           "description", "publisher", "num_pages", "language", "categories", "link"],
-            limit=1
-        )
-        if result:
-            books.append(result[0])
-    return {"favorites": books}
+async def get_favorites(limit: int | None = Query(None, ge=1, le=500), offset: int = Query(0, ge=0),
+                        db: AsyncSession = Depends(get_async_db), current_user: UserInDB = Depends(get_current_user)):
+    favorites_query = select(FavoriteInDB).where(FavoriteInDB.user_id == current_user.id)
+    total = await db.scalar(select(func.count()).select_from(favorites_query.subquery()))
+    favorites_query = favorites_query.order_by(FavoriteInDB.id).offset(offset)
+    if limit is not None:
+        favorites_query = favorites_query.limit(limit)
+    favorites = (await db.execute(favorites_query)).scalars().all()
+    books, missing = book_store.get_many([fav.book_id for fav in favorites])
+    return {"favorites": books, "missing": missing, "total": total, "offset": offset, "limit": limit}
 
 @app.delete("/favorites/{book_id}")
 def delete_favorite(book_id: str, db: Session = Depends(get_db), current_user: UserInDB = Depends(get_current_user)):
-    success = remove_from_favorites(db, current_user.id, book_id)
+    vector = None
+    if book_id in get_favorite_ids(db, current_user.id) and has_taste_vector(db, current_user.id):
+        vector = book_vector(book_id)
+    success = remove_from_favorites(db, current_user.id, book_id, book_vector=vector)
     if not success:
         raise HTTPException(status_code=404, detail="Not in favorites")
     return {"message": "Removed from favorites"}
 
+def book_filters(language=None, categories=None, min_year=None, max_year=None, min_pages=None, max_pages=None):
+    filters = {}
+    if language:
+        filters["language"] = language
+    if categories:
+        filters["categories"] = categories
+    if min_year is not None or max_year is not None:
+        filters["publishing_year"] = (min_year, max_year)
+    if min_pages is not None or max_pages is not None:
+        filters["num_pages"] = (min_pages, max_pages)
+    return filters
+
+@app.get("/recommendations/for-you")
+def recommend_for_you(limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE), offset: int = Query(0, ge=0),
+                      language: list[str] | None = Query(None), categories: list[str] | None = Query(None),
+                      min_year: int | None = Query(None), max_year: int | None = Query(None),
+                      min_pages: int | None = Query(None, ge=0), max_pages: int | None = Query(None, ge=0),
+                      db: Session = Depends(get_db), current_user: UserInDB = Depends(get_current_user)):
+    favorite_ids = get_favorite_ids(db, current_user.id)
+    taste = get_taste_vector(db, current_user.id)
+    if favorite_ids and (taste is None or taste[1] != len(favorite_ids)):
+        vectors = vector_store.vectors(favorite_ids)
+        taste = save_taste_vector(db, current_user.id, list(vectors.values()), len(favorite_ids))
+    results = []
+    if favorite_ids:
+        filters = book_filters(language, categories, min_year, max_year, min_pages, max_pages)
+        results = recommend_for_taste(taste[0], favorite_ids, limit=limit, offset=offset, filters=filters)
+    has_more = len(results) == limit and offset + limit < MAX_RESULTS
+    return {
+        "results": results,
+        "limit": limit,
+        "offset": offset,
+        "next_offset": offset + limit if has_more else None
+    }
+
 @app.get("/bookrcm")
-def recommend(query: str = Query(...)):
+async def recommend(query: str = Query(...), limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE), offset: int = Query(0, ge=0),
+              k: int | None = Query(None, ge=1),
+              language: list[str] | None = Query(None), categories: list[str] | None = Query(None),
+              min_year: int | None = Query(None), max_year: int | None = Query(None),
+              min_pages: int | None = Query(None, ge=0), max_pages: int | None = Query(None, ge=0)):
+    # `k` is the old name of `limit`, still sent by older clients; it gets the same per-page cap.
+    if k is not None:
+        limit = min(k, MAX_PAGE_SIZE)
+    filters = book_filters(language, categories, min_year, max_year, min_pages, max_pages)
     try:
-        result = recommend_books(query)
+        result = await arecommend_books(query, limit=limit, offset=offset, filters=filters)
 
         if hasattr(result, "usage"):
-            usage = result.usage
-            db = SessionLocal()
-            db.execute(
-                text("INSERT INTO openai_logs (purpose, input_tokens, output_tokens) VALUES (:p, :in_t, :out_t)"),
-                {"p": "chatbot", "in_t": usage.prompt_tokens, "out_t": usage.completion_tokens}
-            )
-            db.commit()
-            db.close()
-
-        return {"results": result.data if hasattr(result, "data") else result}
+            log_openai_usage("chatbot", result.usage)
+
+        results = result.data if hasattr(result, "data") else result
+        has_more = len(results) == limit and offset + limit < MAX_RESULTS
+        return {
+            "results": results,
+            "limit": limit,
+            "offset": offset,
+            "next_offset": offset + limit if has_more else None
+        }
     except Exception as e:
         return {"error": str(e)}
 
+def log_openai_usage(purpose: str, usage):
+    usage_recorder.record(purpose, usage.prompt_tokens, usage.completion_tokens)
+
 @app.get("/suggestions")
-def suggestions(query: str = Query(...)):
+async def suggestions(query: str = Query(...)):
     try:
         return {"suggestions": fetch_book_suggestions(query)}
     except Exception as e:
@@ -231,94 +385,177 @@ class ExplainRequest(BaseModel):
 
 @app.post("/explain")
 async def explain_book(data: ExplainRequest):
-    prompt = f"""You're a helpful book recommender.
-Title: {data.title}
-Author(s): {data.author}
-Description: {data.description}
-Explain to a reader why they might like this book in 2-3 Vietnamese sentences."""
+    async def produce():
+        async with openai_pool.slot() as client:
+            reason, usage = await generate_explanation(client, data.title, data.author, data.description)
+        log_openai_usage("chatbot", usage)
+        return reason
+
     try:
-        client = AsyncOpenAI()
-        res = await client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You're a friendly book expert."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=120
-        )
-        usage = res.usage
-        db = SessionLocal()
-        db.execute(
-            text("INSERT INTO openai_logs (purpose, input_tokens, output_tokens) VALUES (:p, :in_t, :out_t)"),
-            {"p": "chatbot", "in_t": usage.prompt_tokens, "out_t": usage.completion_tokens}
-        )
-        db.commit()
-        db.close()
-        return {"reason": res.choices[0].message.content.strip()}
+        key = explanation_key(data.title, data.author, data.description)
+        return {"reason": await explanation_cache.get_or_create(key, produce)}
     except Exception as e:
         return {"error": str(e)}
 
+def sse_event(event: str, data: dict):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+# Forwards completion chunks as `delta` events, then sends `done` with the full text
+# and records the usage reported in the final chunk.
+async def stream_completion(chunks, purpose: str, on_complete=None):
+    parts = []
+    try:
+        async for chunk in chunks:
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+                yield sse_event("delta", {"text": chunk.choices[0].delta.content})
+            if chunk.usage:
+                log_openai_usage(purpose, chunk.usage)
+        text_out = "".join(parts).strip()
+        if on_complete:
+            await on_complete(text_out)
+        yield sse_event("done", {"text": text_out})
+    except Exception as e:
+        yield sse_event("error", {"error": str(e)})
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+@app.post("/explain/stream")
+async def explain_book_stream(data: ExplainRequest):
+    key = explanation_key(data.title, data.author, data.description)
+    cached = await explanation_cache.aget(key)
+    if cached is not None:
+        async def replay():
+            yield sse_event("delta", {"text": cached})
+            yield sse_event("done", {"text": cached})
+        return StreamingResponse(replay(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+    chunks = openai_pool.iterate(stream_explanation(openai_pool.client, data.title, data.author, data.description))
+    return StreamingResponse(
+        stream_completion(chunks, "chatbot", on_complete=lambda reason: explanation_cache.aput(key, reason)),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
 class ChatRequest(BaseModel):
     message: str
 
-@app.post("/chatbot-recommend")
-async def chatbot(data: ChatRequest):
+def chatbot_messages(message: str):
     prompt = f"""You're a helpful book recommender. Based on this question from the user:
-"{data.message}"
+"{message}"
 Suggest 1–2 suitable books and explain shortly in Vietnamese. If they have any question from any book or books from you provided, answer them in Vietnamese."""
+    return [
+        {"role": "system", "content": "You're a friendly book expert."},
+        {"role": "user", "content": prompt}
+    ]
+
+@app.post("/chatbot-recommend")
+async def chatbot(data: ChatRequest):
     try:
-        client = AsyncOpenAI()
-        res = await client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You're a friendly book expert."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=300
-        )
-        usage = res.usage
-        db = SessionLocal()
-        db.execute(
-            text("INSERT INTO openai_logs (purpose, input_tokens, output_tokens) VALUES (:p, :in_t, :out_t)"),
-            {"p": "chatbot", "in_t": usage.prompt_tokens, "out_t": usage.completion_tokens}
-        )
-        db.commit()
-        db.close()
+        async with openai_pool.slot() as client:
+            res = await client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=chatbot_messages(data.message),
+                temperature=0.7,
+                max_tokens=300
+            )
+        log_openai_usage("chatbot", res.usage)
         return {"reply": res.choices[0].message.content.strip()}
     except Exception as e:
         return {"error": str(e)}
 
+@app.post("/chatbot-recommend/stream")
+async def chatbot_stream(data: ChatRequest):
+    async def chunks():
+        stream = await openai_pool.client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=chatbot_messages(data.message),
+            temperature=0.7,
+            max_tokens=300,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        async for chunk in stream:
+            yield chunk
+
+    return StreamingResponse(stream_completion(openai_pool.iterate(chunks()), "chatbot"),
+                             media_type="text/event-stream", headers=SSE_HEADERS)
+
+def log_cursor(row):
+    created_at = row[3] if isinstance(row[3], datetime) else datetime.fromisoformat(str(row[3]))
+    return f"{created_at.isoformat()}|{row[4]}"
+
 @app.get("/admin/token-usage")
-def get_token_usage(db: Session = Depends(get_db), current_admin: AdminInDB = Depends(get_current_admin)):
-    rows = db.execute(
-        text("SELECT purpose, input_tokens, output_tokens, created_at FROM openai_logs ORDER BY created_at DESC")
-    ).fetchall()
+async def get_token_usage(start: datetime | None = None, end: datetime | None = None,
+                          granularity: str = Query("day", pattern="^(hour|day)$"),
+                          limit: int = Query(50, ge=1, le=500), cursor: str | None = None,
+                          db: AsyncSession = Depends(get_async_db), current_admin: AdminInDB = Depends(get_current_admin)):
+    # Rollups only exist per whole bucket, so the range is widened to bucket boundaries
+    # for the summary and the logs alike, and the applied range is returned.
+    start, end = bucket_range(start, end, granularity)
+    rollups_query = select(TokenUsageRollup).where(TokenUsageRollup.period == granularity)
+    if start is not None:
+        rollups_query = rollups_query.where(TokenUsageRollup.bucket_start >= start)
+    if end is not None:
+        rollups_query = rollups_query.where(TokenUsageRollup.bucket_start < end)
+    rollups = (await db.execute(rollups_query.order_by(TokenUsageRollup.bucket_start))).scalars().all()
+
     usage_by_purpose = {}
-    logs = []
+    series = []
+    for rollup in rollups:
+        series.append({
+            "bucket_start": rollup.bucket_start,
+            "purpose": rollup.purpose,
+            "requests": rollup.requests,
+            "input_tokens": rollup.input_tokens,
+            "output_tokens": rollup.output_tokens
+        })
+        if rollup.purpose not in usage_by_purpose:
+            usage_by_purpose[rollup.purpose] = {"input": 0, "output": 0, "requests": 0}
+        usage_by_purpose[rollup.purpose]["input"] += rollup.input_tokens
+        usage_by_purpose[rollup.purpose]["output"] += rollup.output_tokens
+        usage_by_purpose[rollup.purpose]["requests"] += rollup.requests
 
+    total_input = sum(p["input"] for p in usage_by_purpose.values())
+    total_output = sum(p["output"] for p in usage_by_purpose.values())
+
+    # Raw logs are paged newest first by (created_at, id), which ix_openai_logs_created_at
+    # (create_usage_rollups.py) serves without sorting the table. Pass next_cursor back
+    # as `cursor` to get the following page.
+    conditions = []
+    params = {"limit": limit}
+    if start is not None:
+        conditions.append("created_at >= :start")
+        params["start"] = start
+    if end is not None:
+        conditions.append("created_at < :end")
+        params["end"] = end
+    if cursor:
+        before_at, _, before_id = cursor.rpartition("|")
+        try:
+            params["before_at"] = datetime.fromisoformat(before_at)
+            params["before_id"] = int(before_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        conditions.append("(created_at < :before_at OR (created_at = :before_at AND id < :before_id))")
+    where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+    rows = (await db.execute(
+        text("SELECT purpose, input_tokens, output_tokens, created_at, id FROM openai_logs "
+             f"{where}ORDER BY created_at DESC, id DESC LIMIT :limit"),
+        params
+    )).fetchall()
+    logs = []
     for row in rows:
-        purpose = row[0]
         input_tokens = row[1] or 0
         output_tokens = row[2] or 0
-        created_at = row[3]
         logs.append({
-            "purpose": purpose,
+            "purpose": row[0],
             "input_tokens": input_tokens,
             "output_tokens": output_tokens,
             "total_tokens": input_tokens + output_tokens,
-            "created_at": created_at
+            "created_at": row[3]
         })
 
-        if purpose not in usage_by_purpose:
-            usage_by_purpose[purpose] = {"input": 0, "output": 0}
-        usage_by_purpose[purpose]["input"] += input_tokens
-        usage_by_purpose[purpose]["output"] += output_tokens
-
-    total_input = sum(p["input"] for p in usage_by_purpose.values())
-    total_output = sum(p["output"] for p in usage_by_purpose.values())
-
     return {
         "summary": {
             "by_purpose": usage_by_purpose,
@@ -326,5 +563,10 @@ def get_token_usage(db: Session = Depends(get_db), current_admin: AdminInDB = De
             "total_output_tokens": total_output,
             "total_tokens": total_input + total_output
         },
-        "logs": logs
+        "series": series,
+        "start": start,
+        "end": end,
+        "logs": logs,
+        "limit": limit,
+        "next_cursor": log_cursor(rows[-1]) if len(rows) == limit else None
     }
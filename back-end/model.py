@@ -1,6 +1,6 @@
-from sqlalchemy import Column, Integer, String, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, ForeignKey, UniqueConstraint, LargeBinary
 from sqlalchemy.orm import declarative_base
-from pydantic import BaseModel, constr, field_validator
+from pydantic import BaseModel, constr, conlist, field_validator
 import re
 
 Base = declarative_base()
@@ -21,9 +21,29 @@ class AdminInDB(Base):
 
 class FavoriteInDB(Base):
     __tablename__ = 'favorites'
+    __table_args__ = (UniqueConstraint('user_id', 'book_id', name='uq_favorite_user_book'),)
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey('users.id'))
-    book_id = Column(String)
+    book_id = Column(String(64))
+
+# Sum of the embeddings of a user's favorited books (float32 bytes) and how many went
+# into it; the "for you" search uses it normalized.
+class UserTasteVector(Base):
+    __tablename__ = 'user_taste_vectors'
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    vector = Column(LargeBinary, nullable=False)
+    favorite_count = Column(Integer, nullable=False, default=0)
+
+class TokenUsageRollup(Base):
+    __tablename__ = 'openai_usage_rollups'
+    __table_args__ = (UniqueConstraint('period', 'bucket_start', 'purpose', name='uq_rollup_bucket'),)
+    id = Column(Integer, primary_key=True, index=True)
+    period = Column(String(8), nullable=False)
+    bucket_start = Column(DateTime, nullable=False, index=True)
+    purpose = Column(String(64), nullable=False)
+    requests = Column(Integer, nullable=False, default=0)
+    input_tokens = Column(BigInteger, nullable=False, default=0)
+    output_tokens = Column(BigInteger, nullable=False, default=0)
 
 class RegisterUser(BaseModel):
     username: constr(max_length=49)
@@ -48,6 +68,9 @@ class RegisterUser(BaseModel):
 class Favorite(BaseModel):
     book_id: str
 
+class FavoriteStatusRequest(BaseModel):
+    book_ids: conlist(str, max_length=500)
+
 class User(BaseModel):
     identifier: str
     password: str
@@ -0,0 +1,71 @@
+from contextlib import asynccontextmanager
+from openai import AsyncOpenAI
+import asyncio
+import httpx
+import os
+
+OPENAI_MAX_CONNECTIONS = int(os.environ.get("OPENAI_MAX_CONNECTIONS", 100))
+OPENAI_MAX_KEEPALIVE = int(os.environ.get("OPENAI_MAX_KEEPALIVE", 20))
+OPENAI_TIMEOUT = float(os.environ.get("OPENAI_TIMEOUT", 30))
+OPENAI_CONNECT_TIMEOUT = float(os.environ.get("OPENAI_CONNECT_TIMEOUT", 5))
+# The SDK retries 408/409/429/5xx and connection errors with exponential backoff and jitter.
+OPENAI_MAX_RETRIES = int(os.environ.get("OPENAI_MAX_RETRIES", 3))
+# Upper bound on calls in flight at once, so a burst queues here instead of hitting rate limits.
+OPENAI_MAX_CONCURRENCY = int(os.environ.get("OPENAI_MAX_CONCURRENCY", 16))
+
+# One AsyncOpenAI client for the whole process, so its httpx connection pool (and the
+# TLS sessions in it) is reused by every request.
+class OpenAIPool:
+    def __init__(self):
+        self._client = None
+        self._semaphore = None
+        self.waiting = 0
+
+    @property
+    def client(self):
+        if self._client is None:
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=OPENAI_MAX_CONNECTIONS,
+                    max_keepalive_connections=OPENAI_MAX_KEEPALIVE
+                ),
+                timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT)
+            )
+            self._client = AsyncOpenAI(http_client=http_client, max_retries=OPENAI_MAX_RETRIES)
+        return self._client
+
+    def open(self):
+        return self.client
+
+    @asynccontextmanager
+    async def slot(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(OPENAI_MAX_CONCURRENCY)
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        try:
+            yield self.client
+        finally:
+            self._semaphore.release()
+
+    async def iterate(self, chunks):
+        # Holds a slot for the whole life of a streamed response.
+        async with self.slot():
+            async for chunk in chunks:
+                yield chunk
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+    def stats(self):
+        in_flight = 0
+        if self._semaphore is not None:
+            in_flight = OPENAI_MAX_CONCURRENCY - self._semaphore._value
+        return {"in_flight": in_flight, "waiting": self.waiting, "max_concurrency": OPENAI_MAX_CONCURRENCY}
+
+openai_pool = OpenAIPool()
@@ -0,0 +1,57 @@
+from openai_client import openai_pool
+from sqlalchemy import select, func
+from userdb import async_session_scope
+from model import FavoriteInDB
+from books import BookStore
+from explanations import ExplanationCache, explanation_key, generate_explanation
+from usage_recorder import UsageRecorder
+import asyncio
+import getpass
+import os
+import sys
+
+# Fills the /explain cache for the N most favorited books, e.g. `python prewarm_explanations.py 500`.
+
+if not os.environ.get("OPENAI_API_KEY"):
+    os.environ["OPENAI_API_KEY"] = getpass.getpass("YOUR_OPENAI_API_KEY")
+
+top_n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+concurrency = int(os.environ.get("PREWARM_CONCURRENCY", 4))
+
+book_store = BookStore(os.environ.get("BOOK_METADATA_PATH", "./data/dataset/new/books_full.csv"))
+explanation_cache = ExplanationCache(os.environ.get("EXPLAIN_CACHE_DB", "./explanations.sqlite3"))
+
+async def main():
+    async with async_session_scope() as db:
+        rows = (await db.execute(
+            select(FavoriteInDB.book_id, func.count().label("n"))
+            .group_by(FavoriteInDB.book_id)
+            .order_by(func.count().desc())
+            .limit(top_n)
+        )).all()
+    books, missing = book_store.get_many([row[0] for row in rows], fields=["id", "title", "author", "description"])
+    if missing:
+        print(f"Skipping {len(missing)} books missing from the metadata store.")
+
+    recorder = UsageRecorder(async_session_scope)
+    await recorder.start()
+    semaphore = asyncio.Semaphore(concurrency)
+    created = 0
+
+    async def warm(book):
+        nonlocal created
+        key = explanation_key(book["title"], book["author"], book["description"])
+        if explanation_cache.get(key) is not None:
+            return
+        async with semaphore, openai_pool.slot() as client:
+            reason, usage = await generate_explanation(client, book["title"], book["author"], book["description"])
+        explanation_cache.put(key, reason)
+        recorder.record("chatbot", usage.prompt_tokens, usage.completion_tokens)
+        created += 1
+
+    await asyncio.gather(*(warm(book) for book in books))
+    await recorder.stop()
+    await openai_pool.aclose()
+    print(f"Prewarmed {created} explanations ({len(books) - created} already cached).")
+
+asyncio.run(main())
@@ -1,24 +1,110 @@
+from text_folding import fold_text
 import pandas as pd
+from bisect import bisect_left
+from collections import defaultdict
+import heapq
 
 df = pd.read_csv("./data/dataset/new/books_full.csv")
 
-def fetch_book_suggestions(query):
-    query = query.lower()
-    suggestions = set()
+MAX_SUGGESTIONS = 10
+NGRAM = 3
+# Prefixes up to this length have their top suggestions precomputed, since their
+# ranges in the sorted key array cover a large part of the dataset.
+SHORT_PREFIX = 2
+
+# Match quality, lower is better.
+EXACT, PREFIX, WORD_PREFIX, SUBSTRING = 0, 1, 2, 3
+
+def _ngrams(value):
+    return {value[i:i + NGRAM] for i in range(len(value) - NGRAM + 1)}
+
+class SuggestionIndex:
+    def __init__(self, frame):
+        counts = defaultdict(int)
+        for column in ("title", "author", "categories"):
+            if column not in frame:
+                continue
+            for value in frame[column].dropna().astype(str):
+                parts = value.split("/") if column == "categories" else [value]
+                for part in {p.strip() for p in parts}:
+                    if part:
+                        counts[part] += 1
+
+        # Terms are ordered by popularity (number of books they appear on), so a lower
+        # term id always means a more popular term.
+        ordered = sorted(counts.items(), key=lambda item: (-item[1], len(item[0]), item[0]))
+        self.terms = [term for term, _ in ordered]
+        self.folded = [fold_text(term) for term in self.terms]
+
+        # Sorted (key, term id, quality) array: the whole folded term, plus every suffix
+        # starting at a word boundary so "anh" finds "Nguyễn Nhật Ánh".
+        keys = []
+        for term_id, folded in enumerate(self.folded):
+            if not folded:
+                continue
+            keys.append((folded, term_id, PREFIX))
+            for i in range(1, len(folded)):
+                if folded[i - 1] == " ":
+                    keys.append((folded[i:], term_id, WORD_PREFIX))
+        keys.sort()
+        self.keys = keys
+        self.key_text = [k[0] for k in keys]
 
-    for _, row in df.iterrows():
-        title = str(row.get("title", "")).lower()
-        authors = str(row.get("author", "")).lower()
-        categories = str(row.get("categories", "")).lower()
+        postings = defaultdict(list)
+        for term_id, folded in enumerate(self.folded):
+            for gram in _ngrams(folded):
+                postings[gram].append(term_id)
+        self.ngrams = dict(postings)
 
-        if query in title:
-            suggestions.add(row["title"])
-        if query in authors:
-            suggestions.add(row["author"])
-        if query in categories:
-            suggestions.update([cat.strip() for cat in categories.split("/")])
+        self.short_prefix_top = {}
+        groups = defaultdict(list)
+        for folded, term_id, quality in keys:
+            for n in range(1, min(SHORT_PREFIX, len(folded)) + 1):
+                prefix = folded[:n]
+                groups[prefix].append((EXACT if quality == PREFIX and folded == prefix else quality, term_id))
+        for prefix, candidates in groups.items():
+            self.short_prefix_top[prefix] = self._best(candidates, MAX_SUGGESTIONS)
 
-        if len(suggestions) >= 10:
-            break
+    def _best(self, candidates, limit):
+        best = {}
+        for quality, term_id in candidates:
+            if quality < best.get(term_id, SUBSTRING + 1):
+                best[term_id] = quality
+        return heapq.nsmallest(limit, ((q, t) for t, q in best.items()))
 
-    return [{"query": s} for s in list(suggestions)[:10]]
+    def _prefix_matches(self, query):
+        start = bisect_left(self.key_text, query)
+        end = bisect_left(self.key_text, query + "\uffff", lo=start)
+        for folded, term_id, quality in self.keys[start:end]:
+            yield (EXACT if folded == query and quality == PREFIX else quality), term_id
+
+    def _substring_matches(self, query):
+        grams = sorted((self.ngrams.get(g, ()) for g in _ngrams(query)), key=len)
+        if not grams or not grams[0]:
+            return
+        candidates = set(grams[0])
+        for posting in grams[1:]:
+            candidates.intersection_update(posting)
+            if not candidates:
+                return
+        for term_id in candidates:
+            if query in self.folded[term_id]:
+                yield SUBSTRING, term_id
+
+    def search(self, query, limit=MAX_SUGGESTIONS):
+        query = fold_text(query)
+        if not query:
+            return []
+        if len(query) <= SHORT_PREFIX and limit <= MAX_SUGGESTIONS:
+            ranked = self.short_prefix_top.get(query, [])[:limit]
+        else:
+            candidates = list(self._prefix_matches(query))
+            if len(query) >= NGRAM:
+                candidates.extend(self._substring_matches(query))
+            ranked = self._best(candidates, limit)
+        return [self.terms[term_id] for _, term_id in ranked]
+
+suggestion_index = SuggestionIndex(df)
+
+def fetch_book_suggestions(query):
+    return [{"query": s} for s in suggestion_index.search(query)]
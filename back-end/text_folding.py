@@ -0,0 +1,13 @@
+import re
+import unicodedata
+
+TOKEN = re.compile(r"\w+")
+
+def fold_text(value):
+    # Lowercase and strip diacritics so "trinh tham" matches "Trinh Thám".
+    value = unicodedata.normalize("NFD", str(value).lower().replace("đ", "d"))
+    value = "".join(c for c in value if unicodedata.category(c) != "Mn")
+    return " ".join(value.split())
+
+def tokenize(value):
+    return TOKEN.findall(fold_text(value))
@@ -0,0 +1,127 @@
+from collections import deque
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from sqlalchemy.dialects import mysql, sqlite
+from model import TokenUsageRollup
+import asyncio
+
+INSERT_LOGS = text(
+    "INSERT INTO openai_logs (purpose, input_tokens, output_tokens, created_at) VALUES (:p, :in_t, :out_t, :at)"
+)
+
+ROLLUP_PERIODS = {
+    "hour": lambda t: t.replace(minute=0, second=0, microsecond=0),
+    "day": lambda t: t.replace(hour=0, minute=0, second=0, microsecond=0),
+}
+ROLLUP_LENGTHS = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+
+# Widens [start, end) to whole buckets of the period, so rollups and raw logs cover
+# the same time range.
+def bucket_range(start, end, period):
+    truncate = ROLLUP_PERIODS[period]
+    if start is not None:
+        start = truncate(start)
+    if end is not None and truncate(end) != end:
+        end = truncate(end) + ROLLUP_LENGTHS[period]
+    return start, end
+
+def rollup_values(rows):
+    totals = {}
+    for row in rows:
+        for period, truncate in ROLLUP_PERIODS.items():
+            key = (period, truncate(row["at"]), row["p"])
+            bucket = totals.setdefault(key, [0, 0, 0])
+            bucket[0] += 1
+            bucket[1] += row["in_t"] or 0
+            bucket[2] += row["out_t"] or 0
+    return [
+        {"period": period, "bucket_start": start, "purpose": purpose,
+         "requests": counts[0], "input_tokens": counts[1], "output_tokens": counts[2]}
+        for (period, start, purpose), counts in totals.items()
+    ]
+
+# Adds the batch's totals onto the hourly and daily rollup rows, creating them if needed.
+def rollup_statement(dialect_name: str, values):
+    table = TokenUsageRollup.__table__
+    if dialect_name == "mysql":
+        stmt = mysql.insert(table).values(values)
+        return stmt.on_duplicate_key_update(
+            requests=table.c.requests + stmt.inserted.requests,
+            input_tokens=table.c.input_tokens + stmt.inserted.input_tokens,
+            output_tokens=table.c.output_tokens + stmt.inserted.output_tokens
+        )
+    stmt = sqlite.insert(table).values(values)
+    return stmt.on_conflict_do_update(
+        index_elements=["period", "bucket_start", "purpose"],
+        set_={
+            "requests": table.c.requests + stmt.excluded.requests,
+            "input_tokens": table.c.input_tokens + stmt.excluded.input_tokens,
+            "output_tokens": table.c.output_tokens + stmt.excluded.output_tokens
+        }
+    )
+
+# Collects openai_logs rows in memory and writes them as multi-row inserts, either
+# when batch_size rows are waiting or every flush_interval seconds, so token
+# accounting never adds a DB round trip to a request. The hourly and daily rollups
+# are updated in the same transaction.
+class UsageRecorder:
+    def __init__(self, session_factory, batch_size=200, flush_interval=2.0, max_pending=50000):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.written = 0
+        self.dropped = 0
+        self._pending = deque()
+        self._wakeup = None
+        self._task = None
+        self._stopping = False
+
+    def record(self, purpose: str, input_tokens: int, output_tokens: int):
+        if len(self._pending) >= self.max_pending:
+            self.dropped += 1
+            return
+        self._pending.append({"p": purpose, "in_t": input_tokens, "out_t": output_tokens, "at": datetime.now()})
+        if len(self._pending) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    async def start(self):
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        while self._pending:
+            batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+            try:
+                async with self.session_factory() as db:
+                    await db.execute(INSERT_LOGS, batch)
+                    await db.execute(rollup_statement(db.bind.dialect.name, rollup_values(batch)))
+                    await db.commit()
+                self.written += len(batch)
+            except Exception as e:
+                # Keep the rows for the next attempt instead of losing the accounting.
+                print(" [UsageRecorder] Flush failed:", e)
+                self._pending.extendleft(reversed(batch))
+                return
+
+    async def stop(self):
+        self._stopping = True
+        if self._wakeup is not None:
+            self._wakeup.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        await self.flush()
+
+    def stats(self):
+        return {"pending": len(self._pending), "written": self.written, "dropped": self.dropped}
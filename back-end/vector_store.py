@@ -0,0 +1,250 @@
+from books import METADATA_FIELDS, MULTI_VALUE_FIELDS, book_columns, deleted_books, fetch_books
+from data.openai.milvus_index import search_params, search_params_for
+from abc import ABC, abstractmethod
+import json
+import os
+import threading
+import numpy as np
+import pandas as pd
+
+# Multi-value fields are stored in Milvus joined with this (crawl_fahasa.py).
+MULTI_VALUE_SEPARATOR = " / "
+
+def _like_literal(value):
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+# One value of a " / "-joined field: the whole field, its first, last or a middle entry.
+def _contains_any(field, values):
+    clauses = []
+    for value in values:
+        literal = _like_literal(value)
+        clauses.append(f"{field} == {json.dumps(value, ensure_ascii=False)}")
+        for pattern in (f"{literal}{MULTI_VALUE_SEPARATOR}%", f"%{MULTI_VALUE_SEPARATOR}{literal}",
+                        f"%{MULTI_VALUE_SEPARATOR}{literal}{MULTI_VALUE_SEPARATOR}%"):
+            clauses.append(f"{field} like {json.dumps(pattern, ensure_ascii=False)}")
+    return "(" + " or ".join(clauses) + ")"
+
+# Filters are a dict of field -> value, list of values, or (low, high) range with
+# None for an open end, e.g. {"language": "Tiếng Việt", "publishing_year": (2015, None)}.
+# A missing year or page count is stored as 0, so a range never matches it.
+def milvus_expr(filters):
+    clauses = []
+    for field, condition in (filters or {}).items():
+        if field in MULTI_VALUE_FIELDS:
+            clauses.append(_contains_any(field, condition if isinstance(condition, list) else [condition]))
+        elif isinstance(condition, tuple):
+            low, high = condition
+            if low is not None or high is not None:
+                clauses.append(f"{field} > 0")
+            if low is not None:
+                clauses.append(f"{field} >= {json.dumps(low)}")
+            if high is not None:
+                clauses.append(f"{field} <= {json.dumps(high)}")
+        elif isinstance(condition, list):
+            clauses.append(f"{field} in {json.dumps(condition, ensure_ascii=False)}")
+        else:
+            clauses.append(f"{field} == {json.dumps(condition, ensure_ascii=False)}")
+    return " and ".join(clauses)
+
+def filter_mask(mask, ids, columns, filters):
+    for field, condition in (filters or {}).items():
+        column = ids if field == "id" else columns[field]
+        if field in MULTI_VALUE_FIELDS:
+            wanted = {str(v).strip() for v in (condition if isinstance(condition, list) else [condition])}
+            values = columns[f"{field}_values"]
+            mask &= np.fromiter((not wanted.isdisjoint(v) for v in values), dtype=bool, count=len(values))
+        elif isinstance(condition, tuple):
+            low, high = condition
+            if low is not None or high is not None:
+                mask &= column > 0
+            if low is not None:
+                mask &= column >= low
+            if high is not None:
+                mask &= column <= high
+        elif isinstance(condition, list):
+            mask &= np.isin(column, condition)
+        else:
+            mask &= column == condition
+    return mask
+
+# Interface shared by the Milvus-backed store and the in-process engine. Hits are
+# dicts with "id", "score" and the book metadata fields.
+class VectorStore(ABC):
+    @abstractmethod
+    def search(self, vector, k, filters=None):
+        ...
+
+    @abstractmethod
+    def missing(self, ids):
+        ...
+
+    # id -> stored embedding, for the ids that exist.
+    @abstractmethod
+    def vectors(self, ids):
+        ...
+
+    @abstractmethod
+    def delete(self, ids):
+        ...
+
+    @abstractmethod
+    def count(self):
+        ...
+
+class MilvusVectorStore(VectorStore):
+    def __init__(self, uri, collection_name, vector_field="vector", params=None):
+        from pymilvus import connections, Collection
+
+        connections.connect(alias="default", uri=uri)
+        self.collection = Collection(collection_name)
+        self.collection.load()
+        self.vector_field = vector_field
+        self.search_params = params or search_params()
+
+    def search(self, vector, k, filters=None):
+        results = self.collection.search(
+            data=[list(map(float, vector))],
+            anns_field=self.vector_field,
+            param=search_params_for(self.search_params, k),
+            limit=k,
+            expr=milvus_expr(filters) or None,
+            output_fields=METADATA_FIELDS
+        )
+        return [
+            {"id": str(hit.id), "score": hit.distance, **{f: hit.entity.get(f) for f in METADATA_FIELDS}}
+            for hit in results[0]
+        ]
+
+    def missing(self, ids):
+        return fetch_books(self.collection, ids, output_fields=["id"])[1]
+
+    def vectors(self, ids):
+        books, _ = fetch_books(self.collection, ids, output_fields=["id", self.vector_field])
+        return {str(book["id"]): np.asarray(book[self.vector_field], dtype=np.float32) for book in books}
+
+    def delete(self, ids):
+        self.collection.delete(expr=f"id in {json.dumps([str(i) for i in ids])}")
+
+    def count(self):
+        return self.collection.num_entities
+
+# Coarse k-means partitioning of the matrix. A search scores only the rows in the
+# nprobe clusters whose centroids are closest to the query.
+class IVFIndex:
+    def __init__(self, matrix, nlist, iterations=10, sample_size=50000, seed=0):
+        rng = np.random.default_rng(seed)
+        rows = len(matrix)
+        nlist = max(1, min(nlist, rows))
+        sample = np.asarray(matrix[np.sort(rng.choice(rows, min(rows, sample_size), replace=False))])
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)]
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = sample[assignment == c]
+                if len(members):
+                    centroid = members.mean(axis=0)
+                    centroids[c] = centroid / (np.linalg.norm(centroid) or 1)
+        self.centroids = centroids
+
+        assignment = np.empty(rows, dtype=np.int32)
+        for start in range(0, rows, 65536):
+            assignment[start:start + 65536] = np.argmax(np.asarray(matrix[start:start + 65536]) @ centroids.T, axis=1)
+        order = np.argsort(assignment, kind="stable")
+        bounds = np.searchsorted(assignment[order], np.arange(nlist + 1))
+        self.lists = [order[bounds[c]:bounds[c + 1]] for c in range(nlist)]
+
+    def candidates(self, query, nprobe):
+        nearest = np.argsort(-(self.centroids @ query))[:nprobe]
+        return np.sort(np.concatenate([self.lists[c] for c in nearest]))
+
+# In-process engine over a Milvus export written by data/extract_milvus.py: inner
+# product over a memory-mapped float32 matrix, exact by default, through an IVF index
+# when nlist is set. The export is never rewritten, so deletions are kept as tombstones.
+class LocalVectorStore(VectorStore):
+    def __init__(self, vectors_path, metadata_path, nlist=None, nprobe=16, tombstones=deleted_books):
+        self.matrix = np.load(vectors_path, mmap_mode="r")
+        frame = pd.read_csv(metadata_path, dtype=str, keep_default_na=False, encoding="utf-8-sig")
+        if len(frame) != len(self.matrix):
+            raise ValueError(f"{metadata_path} has {len(frame)} rows but {vectors_path} has {len(self.matrix)}")
+        self.ids, self.columns = book_columns(frame)
+        self.positions = {book_id: i for i, book_id in enumerate(self.ids)}
+        self.alive = np.ones(len(self.ids), dtype=bool)
+        self.nprobe = nprobe
+        self.index = IVFIndex(self.matrix, nlist) if nlist else None
+        self.tombstones = tombstones
+        self.deleted_version = None
+        self._lock = threading.Lock()
+        self._apply_deletions()
+
+    # Applies deletions made since the last call, including by other workers.
+    def _apply_deletions(self):
+        self.deleted_version = self.tombstones.apply(self.positions, self.alive, self.deleted_version, self._lock)
+
+    def _scores(self, query, rows=None):
+        if rows is not None:
+            return np.asarray(self.matrix[rows]) @ query
+        scores = np.empty(len(self.matrix), dtype=np.float32)
+        for start in range(0, len(self.matrix), 65536):
+            scores[start:start + 65536] = np.asarray(self.matrix[start:start + 65536]) @ query
+        return scores
+
+    def search(self, vector, k, filters=None, nprobe=None):
+        query = np.asarray(vector, dtype=np.float32)
+        self._apply_deletions()
+        with self._lock:
+            mask = filter_mask(self.alive.copy(), self.ids, self.columns, filters)
+        if self.index is not None:
+            rows = self.index.candidates(query, nprobe or self.nprobe)
+            rows = rows[mask[rows]]
+        else:
+            rows = np.flatnonzero(mask)
+        if not len(rows):
+            return []
+        scores = self._scores(query, rows if len(rows) < len(self.matrix) else None)
+        k = min(k, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [
+            {
+                "id": str(self.ids[rows[i]]),
+                "score": float(scores[i]),
+                **{f: plain_value(self.columns[f][rows[i]]) for f in METADATA_FIELDS}
+            }
+            for i in top
+        ]
+
+    def missing(self, ids):
+        self._apply_deletions()
+        with self._lock:
+            return [str(i) for i in ids if str(i) not in self.positions or not self.alive[self.positions[str(i)]]]
+
+    def vectors(self, ids):
+        self._apply_deletions()
+        with self._lock:
+            positions = {str(i): self.positions.get(str(i)) for i in ids}
+            found = {i: p for i, p in positions.items() if p is not None and self.alive[p]}
+        return {i: np.asarray(self.matrix[p], dtype=np.float32) for i, p in found.items()}
+
+    def delete(self, ids):
+        self.tombstones.add(ids)
+        self._apply_deletions()
+
+    def count(self):
+        self._apply_deletions()
+        return int(self.alive.sum())
+
+def plain_value(value):
+    return value.item() if hasattr(value, "item") else value
+
+def create_vector_store(backend=None, **milvus_options):
+    backend = backend or os.environ.get("VECTOR_BACKEND", "milvus")
+    if backend == "local":
+        export_dir = os.environ.get("VECTOR_EXPORT_DIR", "./data")
+        nlist = os.environ.get("LOCAL_IVF_NLIST")
+        return LocalVectorStore(
+            os.path.join(export_dir, "milvus_vectors.npy"),
+            os.path.join(export_dir, "milvus_books.csv"),
+            nlist=int(nlist) if nlist else None,
+            nprobe=int(os.environ.get("LOCAL_IVF_NPROBE", 16))
+        )
+    return MilvusVectorStore(**milvus_options)
@@ -15,10 +15,14 @@ function HomeContent() {
     const [selectedBook, setSelectedBook] = useState(null);
     const [explanation, setExplanation] = useState(null);
     const [suggestions, setSuggestions] = useState([]);
+    const [searchedQuery, setSearchedQuery] = useState("");
+    const [hasMore, setHasMore] = useState(false);
+    const [lastPage, setLastPage] = useState(1);
 
+    // Pages are fetched one at a time; the server says through next_offset whether another exists.
     const booksPerPage = 20;
-    const totalPages = Math.ceil(books.length / booksPerPage);
-    const currentBooks = books.slice((currentPage - 1) * booksPerPage, currentPage * booksPerPage);
+    const totalPages = Math.max(lastPage, hasMore ? currentPage + 1 : currentPage);
+    const currentBooks = books;
 
     const fetchSuggestions = async (userQuery) => {
         try {
@@ -30,21 +34,30 @@ function HomeContent() {
         }
     };
 
-    const searchBooks = async () => {
-        if (!query.trim()) return;
+    const fetchPage = async (searchQuery, page) => {
         setLoading(true);
-        setSuggestions([]);
         try {
-            const res = await fetch(`http://127.0.0.1:8080/bookrcm?query=${query}&k=1000`);
+            const offset = (page - 1) * booksPerPage;
+            const res = await fetch(`http://127.0.0.1:8080/bookrcm?query=${encodeURIComponent(searchQuery)}&limit=${booksPerPage}&offset=${offset}`);
             const data = await res.json();
             setBooks(data.results || []);
-            setCurrentPage(1);
+            setHasMore(data.next_offset != null);
+            setCurrentPage(page);
+            setLastPage(prev => Math.max(prev, page));
         } catch (error) {
             console.error("Error fetching recommendations:", error);
         }
         setLoading(false);
     };
 
+    const searchBooks = async () => {
+        if (!query.trim()) return;
+        setSuggestions([]);
+        setSearchedQuery(query);
+        setLastPage(1);
+        await fetchPage(query, 1);
+    };
+
     const explainBook = async (book) => {
         setExplanation("Loading...");
         try {
@@ -92,7 +105,7 @@ function HomeContent() {
 
     const handlePageChange = (page) => {
         if (page < 1 || page > totalPages) return;
-        setCurrentPage(page);
+        fetchPage(searchedQuery, page);
         window.scrollTo({ top: 0, behavior: "smooth" });
     };
 